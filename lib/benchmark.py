@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import time
+import struct
+import shutil
+import platform
+import tempfile
+import subprocess
+from timeit import default_timer
+
+import numpy as np
+
+import lib
+import datamanagers as dm
+from spearman import Spearman, REGISTRY, Model
+from sliding import SlidingSpearman
+from recording import text_to_binary
+from tcp_client import SpearmanSocketListener
+
+
+class FrameSource(object):
+    """ replays one prepared frame instead of tcp connection """
+
+    def __init__(self, frame):
+        self.frame = memoryview(frame)
+
+    def get_next(self):
+        return self.frame
+
+
+class Benchmark(object):
+    """
+    Pipeline stages benchmark
+
+    times every calculation stage separately
+    on reproducible synthetic data
+
+    public methods:
+    - run - time all stages for all channels and windows
+    - compare - compare results with previous run
+    - over_budget - startup stages slower than budget
+    """
+    CHANNELS = (8, 29, 64, 256)
+    WINDOWS = (10, 100, 1000)
+    MIN_TIME = 0.2
+    MAX_CALLS = 1000
+    PYTHON_LIMIT = 4*10**6
+    SEED = 0
+    REGRESSION = 1.2
+    STARTUP_MODULES = ("spearman", "headless")
+    STARTUP_REPEAT = 5
+    STARTUP_BUDGET = 0.25
+
+    def __init__(self, channels=CHANNELS, windows=WINDOWS, seed=SEED):
+        self.channels = channels
+        self.windows = windows
+        self.random = np.random.RandomState(seed)
+        self.results = list()
+        self.temp_dir = tempfile.mkdtemp()
+
+    def run(self):
+        """ time all stages for all channels and windows """
+        try:
+            self._run_startup()
+            for channels in self.channels:
+                for window in self.windows:
+                    self._run_pipeline(channels, window)
+            self._run_frame_decoding()
+            self._run_canvas_refresh()
+        finally:
+            shutil.rmtree(self.temp_dir)
+
+        return self.results
+
+    def report(self):
+        """ machine-readable report with environment description """
+        return {
+            "time": time.time(),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "backends": REGISTRY.available(),
+            "results": self.results,
+        }
+
+    def compare(self, previous, threshold=REGRESSION):
+        """
+        compare results with previous report,
+        return list of (stage, channels, window, ratio) regressions
+        """
+        old = dict(
+            (self._key(item), item["seconds"])
+            for item in previous["results"]
+            if item["seconds"] is not None
+            )
+
+        regressions = list()
+        for item in self.results:
+            before = old.get(self._key(item))
+            if not before or item["seconds"] is None:
+                continue
+            ratio = item["seconds"]/before
+            if ratio > threshold:
+                regressions.append(self._key(item) + (ratio,))
+
+        return regressions
+
+    def over_budget(self, budget=STARTUP_BUDGET):
+        """ startup stages taking longer than <budget> seconds """
+        return [
+            item for item in self.results
+            if item["stage"].startswith("import ") and
+            item["seconds"] > budget
+            ]
+
+    def _key(self, item):
+        return (item["stage"], item["channels"], item["window"])
+
+    def _run_startup(self):
+        """ time modules import in fresh interpreter """
+        base = self._startup_time("pass")
+        for module in self.STARTUP_MODULES:
+            stage = "import " + module
+            seconds = self._startup_time(stage) - base
+            self._save(stage, None, None, seconds, self.STARTUP_REPEAT)
+
+    def _startup_time(self, code):
+        """ best time of running <code> in new interpreter """
+        lib_dir = os.path.dirname(os.path.abspath(__file__))
+        best = None
+        for x in xrange(self.STARTUP_REPEAT):
+            start = default_timer()
+            subprocess.check_call([sys.executable, "-c", code], cwd=lib_dir)
+            seconds = default_timer() - start
+            if best is None or seconds < best:
+                best = seconds
+
+        return best
+
+    def _run_pipeline(self, channels, window):
+        """ time calculation stages for one configuration """
+        raw_list = self._make_lines(channels, window)
+        core = Spearman()
+        core.set_global(window)
+
+        """ readers Model uses for text and binary files """
+        text, binary, windows = self._make_readers(channels, window)
+        self._time(
+            "MappedFileReader.get_batch", channels, window,
+            text.get_batch, 1, max_calls=windows
+            )
+        self._time(
+            "BinaryReader.get", channels, window,
+            binary.get, max_calls=windows
+            )
+        text.stop()
+        binary.stop()
+
+        sorted_list = core.make_full_list(raw_list)
+        self._time(
+            "make_full_list", channels, window,
+            core.make_full_list, raw_list
+            )
+        val_list = sorted_list.tolist()
+        self._time(
+            "long_sorting", channels, window,
+            core.long_sorting, val_list
+            )
+
+        self._run_sliding(channels, window)
+
+        matrix = REGISTRY.create(Model.BACKEND_MATRIX)
+        try:
+            korr_matrix = matrix.run_matrix(sorted_list, window)
+            self._time(
+                "run_matrix", channels, window,
+                matrix.run_matrix, sorted_list, window
+                )
+        finally:
+            REGISTRY.release(Model.BACKEND_MATRIX)
+        self._time(
+            "matrix_comparing", channels, window,
+            core.matrix_comparing, korr_matrix
+            )
+
+        """ pair expansion path is pure python """
+        elements = channels*(channels-1)//2*window
+        if elements > self.PYTHON_LIMIT:
+            for stage in ("precomparing", "run_gpu", "postcomparing"):
+                self._skip(stage, channels, window)
+            return
+
+        precomp_tuple = core.precomparing(sorted_list)
+        self._time(
+            "precomparing", channels, window,
+            core.precomparing, sorted_list
+            )
+
+        backend = Model.BACKEND_EMULATOR
+        if REGISTRY.backends[Model.BACKEND_CUDA].available():
+            backend = Model.BACKEND_CUDA
+        manager = REGISTRY.create(backend)
+        gpu_args = precomp_tuple[:3] + (window,)
+        try:
+            comp_list = manager.run_gpu(*gpu_args)
+            self._time(
+                "run_gpu", channels, window,
+                manager.run_gpu, *gpu_args
+                )
+        finally:
+            REGISTRY.release(backend)
+        self._time(
+            "postcomparing", channels, window,
+            core.postcomparing, comp_list, channels
+            )
+
+    def _run_sliding(self, channels, window):
+        """
+        time sliding window stages: one sample update
+        and result of updated ranks, compared with
+        result of window ranked anew
+        """
+        lines = self.random.rand(2*window, channels)
+        for incremental, stage in (
+                (True, "SlidingSpearman.push"),
+                (False, "SlidingSpearman.rerank")):
+            sliding = SlidingSpearman(window, 2*window, incremental)
+            sliding.update(lines[:window])
+            if incremental:
+                self._time(
+                    stage, channels, window,
+                    sliding.push, lines[window]
+                    )
+                stage = "SlidingSpearman.sums"
+            self._time(stage, channels, window, sliding._squared_sums)
+
+    def _run_frame_decoding(self):
+        """ time network frame decoding """
+        listener = SpearmanSocketListener("127.0.0.1", 0)
+        listener.tcp_client.disconnect()
+        listener.tcp_client = FrameSource(self._make_frame())
+        self._time(
+            "_read_frame",
+            SpearmanSocketListener.ARRAYS_NUMBER,
+            SpearmanSocketListener.ARRAY_ELEMENTS,
+            listener._read_frame
+            )
+
+    def _run_canvas_refresh(self):
+        """ time canvas refresh if display is available """
+        try:
+            import gui
+            root = gui.tk.Tk()
+        except Exception:
+            for channels in self.channels:
+                self._skip("GraphCanvas.refresh", channels, None)
+                self._skip("TableCanvas.refresh", channels, None)
+            return
+
+        core = Spearman()
+        for channels in self.channels:
+            core.set_global(self.windows[0])
+            raw_list = self._make_lines(channels, self.windows[0])
+            matrix = REGISTRY.create(Model.BACKEND_MATRIX)
+            try:
+                full_dict = core.process(
+                    matrix, core.make_full_list(raw_list)
+                    )
+            finally:
+                REGISTRY.release(Model.BACKEND_MATRIX)
+            for name, canvas_class in (
+                    ("GraphCanvas.refresh", gui.GraphCanvas),
+                    ("TableCanvas.refresh", gui.TableCanvas)):
+                canvas = canvas_class(root)
+                canvas.create(channels)
+                self._time(
+                    name, channels, None,
+                    self._refresh, root, canvas, full_dict["kfs"]
+                    )
+                canvas.destroy()
+
+        root.destroy()
+
+    def _refresh(self, root, canvas, update):
+        canvas.refresh(update)
+        root.update_idletasks()
+
+    def _time(self, stage, channels, window, function, *args, **kwargs):
+        """ call function until MIN_TIME passed, save time pro call """
+        max_calls = kwargs.pop("max_calls", self.MAX_CALLS)
+        calls = 0
+        start = default_timer()
+        while True:
+            function(*args, **kwargs)
+            calls += 1
+            seconds = default_timer() - start
+            if seconds >= self.MIN_TIME or calls >= max_calls:
+                break
+
+        self._save(stage, channels, window, seconds/calls, calls)
+
+    def _skip(self, stage, channels, window):
+        self._save(stage, channels, window, None, 0)
+
+    def _save(self, stage, channels, window, seconds, calls):
+        self.results.append({
+            "stage": stage,
+            "channels": channels,
+            "window": window,
+            "seconds": seconds,
+            "calls": calls,
+        })
+        lib.Debugger.deb("{:<20} {:>4} {:>5} {}".format(
+            stage, channels, window, seconds
+            ))
+
+    def _make_lines(self, channels, window):
+        """ make window of text lines like in input file """
+        values = self.random.rand(window, channels)
+        return [[repr(x) for x in line] for line in values.tolist()]
+
+    def _make_readers(self, channels, window, windows=MAX_CALLS):
+        """ make text and binary readers over synthetic input file """
+        filename = os.path.join(
+            self.temp_dir, "input_{}_{}.txt".format(channels, window)
+            )
+        recording = os.path.splitext(filename)[0] + ".scrc"
+        if window*windows*channels > self.PYTHON_LIMIT:
+            windows = max(self.PYTHON_LIMIT//(window*channels), 1)
+        with open(filename, 'w') as input_file:
+            for x in xrange(windows):
+                for line in self._make_lines(channels, window):
+                    input_file.write(' '.join(line) + '\n')
+
+        text_to_binary(filename, recording, 'd')
+
+        text = dm.MappedFileReader()
+        text.start(filename, window)
+        binary = dm.BinaryReader()
+        binary.start(recording, window)
+        return text, binary, windows
+
+    def _make_frame(self):
+        """ make network data frame """
+        number = (SpearmanSocketListener.ARRAYS_NUMBER *
+                  SpearmanSocketListener.ARRAY_ELEMENTS)
+        header = struct.pack(
+            "i8h8h28si", SpearmanSocketListener.FRAME_TYPE,
+            *([0]*16 + ['\x00'*28, 1000])
+            )
+        values = self.random.randint(-2**15, 2**15, number)
+        return header + struct.pack('h'*number, *values.tolist())
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = lib.ArgParser()
+    arg_parser._initiate_params_benchmark()
+    arguments = arg_parser.parse_args(argv)
+
+    bench = Benchmark(
+        arguments.channels or Benchmark.CHANNELS,
+        arguments.windows or Benchmark.WINDOWS,
+        arguments.seed
+        )
+    bench.run()
+    report = bench.report()
+
+    with open(arguments.output, 'w') as output:
+        json.dump(report, output, indent=1)
+
+    failed = False
+    for item in bench.over_budget():
+        sys.stderr.write("startup budget exceeded: {} {:.3f}s\n".format(
+            item["stage"], item["seconds"]
+            ))
+        failed = True
+
+    if arguments.compare:
+        with open(arguments.compare) as previous:
+            regressions = bench.compare(json.load(previous))
+        for regression in regressions:
+            sys.stderr.write(
+                "regression: {} channels={} window={} x{:.2f}\n".format(
+                    *regression
+                    )
+                )
+        if regressions:
+            failed = True
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,9 +1,17 @@
+import os
+import sys
+import mmap
+
+import numpy as np
+
 from tcp_client import SpearmanSocketListener, AsyncManager
+from recording import RecordingReader, is_recording
 
 
 class DataReader(object):
     """docstring for DataReader"""
     DEFAULT_DISCR = 1000
+    channels = None
 
     def __init__(self, **kwargs):
         self.kwargs = kwargs
@@ -11,6 +19,21 @@ class DataReader(object):
     def get_line(self):
         pass
 
+    def catch_up(self):
+        """ number of queued windows to calculate at once """
+        return 0
+
+    def ready(self, windows=1):
+        """ next <windows> windows can be read without waiting """
+        return True
+
+    def window_times(self):
+        """ time of last line of every window of last get or None """
+        return None
+
+    def metrics(self):
+        return None
+
 
 class NetReader(DataReader):
     """ Simple Socket client """
@@ -24,7 +47,7 @@ class NetReader(DataReader):
 
     def get_line(self):
         line = self.listener.get()
-        print('*'),
+        sys.stderr.write('*')
         return line
 
     def get(self):
@@ -36,20 +59,40 @@ class NetReader(DataReader):
 
 class AsyncReader(DataReader):
     """ Asynchronous Socket client """
-    def start(self, entry_port, entry_host, entry_frame):
+    def start(self, entry_port, entry_host, entry_frame,
+              entry_policy=AsyncManager.POLICY_DECIMATE):
         self.listener = AsyncManager(
-            entry_host, int(entry_port), int(entry_frame)
+            entry_host, int(entry_port), int(entry_frame),
+            policy=entry_policy
             )
         status = self.listener.connect()
         return status
 
     def get(self):
         lines, discr = self.listener.get()
-        print('*'),
+        sys.stderr.write('*')
         if not discr:
             discr = self.DEFAULT_DISCR
         return lines, discr
 
+    def get_batch(self, number):
+        batch, discr = self.listener.get_batch(number)
+        if not discr:
+            discr = self.DEFAULT_DISCR
+        return batch, discr
+
+    def catch_up(self):
+        return self.listener.catch_up()
+
+    def ready(self, windows=1):
+        return self.listener.ready(windows)
+
+    def window_times(self):
+        return self.listener.window_times()
+
+    def metrics(self):
+        return self.listener.metrics()
+
     def stop(self):
         self.listener.disconnect()
 
@@ -84,5 +127,195 @@ class FileReader(DataReader):
             result.append(raw_line.split())
         return result, self.DEFAULT_DISCR
 
+    def get_batch(self, number):
+        """ read up to <number> windows """
+        batch = list()
+        for x in xrange(number):
+            lines, discr = self.get()
+            if not lines:
+                break
+            batch.append(lines)
+        return batch, self.DEFAULT_DISCR
+
     def stop(self):
         self.input_file.close()
+
+
+class MappedFileReader(DataReader):
+    """
+    Memory-mapped file reader
+
+    parses big blocks of text file at once
+    and returns windows as array slices;
+    line with other number of values than the first one
+    raises ValueError when windows before it are returned
+    """
+    BLOCK_SIZE = 2**22
+    DTYPE = np.float64
+
+    def start(self, entry_file, entry_frame):
+        self.window = int(entry_frame)
+        try:
+            self.input_file = open(entry_file, 'rb')
+        except IOError:
+            return False
+
+        self.position = 0
+        self.lines = 0
+        self.error = None
+        self.block = None
+        self.row = 0
+
+        """ empty file can not be mapped """
+        self.size = os.fstat(self.input_file.fileno()).st_size
+        if self.size:
+            self.mapped = mmap.mmap(
+                self.input_file.fileno(), 0, access=mmap.ACCESS_READ
+                )
+            self.channels = len(self._first_line().split())
+        return True
+
+    def get(self):
+        batch, discr = self.get_batch(1)
+        if batch is None:
+            return None, discr
+        return batch[0], discr
+
+    def get_batch(self, number):
+        """ return up to <number> windows as (windows x lines x values) """
+        if not self._fill(self.window):
+            return None, self.DEFAULT_DISCR
+
+        rows = len(self.block) - self.row
+        number = min(number, rows//self.window)
+        end = self.row + number*self.window
+        batch = self.block[self.row:end].reshape(
+            number, self.window, self.channels
+            )
+        self.row = end
+        return batch, self.DEFAULT_DISCR
+
+    def stop(self):
+        if self.size:
+            self.mapped.close()
+        self.input_file.close()
+
+    def _fill(self, lines):
+        """ make sure current block contains at least <lines> lines """
+        while self.block is None or len(self.block) - self.row < lines:
+            if self.error is not None:
+                error, self.error = self.error, None
+                raise error
+            if self.position >= self.size or not self.channels:
+                return False
+
+            end = self._block_end(self.position)
+            text = self.mapped[self.position:end]
+            values = np.fromstring(text, dtype=self.DTYPE, sep=' ')
+            valid = self._check(text, len(values))
+            self.position = end if self.error is None else self.size
+
+            rows = valid//self.channels
+            values = values[:rows*self.channels].reshape(rows, self.channels)
+            if self.block is not None and self.row < len(self.block):
+                """ keep lines left from previous block """
+                values = np.concatenate((self.block[self.row:], values))
+            self.block = values
+            self.row = 0
+
+        return True
+
+    def _check(self, text, parsed):
+        """
+        count values of every line of text at once and return
+        number of values before first line with wrong number of them,
+        ValueError for that line is kept until they are read;
+        <parsed> is number of values parsed from text
+        """
+        data = np.frombuffer(text, dtype=np.uint8)
+        blank = np.concatenate(([True], data <= ord(' '))).view(np.int8)
+        """ value starts where blank character is followed by other one """
+        starts = np.flatnonzero(np.diff(blank) < 0)
+        line_ends = np.flatnonzero(data == ord('\n'))
+        counts = np.diff(np.concatenate((
+            [0], np.searchsorted(starts, line_ends), [len(starts)]
+            )))
+
+        wrong = np.flatnonzero(counts*(counts != self.channels))
+        if not len(wrong) and parsed != len(starts):
+            """ not numeric value stops parsing """
+            lines = np.cumsum(counts)
+            wrong = np.flatnonzero(lines > parsed)[:1]
+        if len(wrong):
+            self.error = ValueError("line {} has not {} numeric values".format(
+                self.lines + wrong[0] + 1, self.channels
+                ))
+            return int(counts[:wrong[0]].sum())
+        self.lines += len(line_ends)
+        return parsed
+
+    def _block_end(self, position):
+        """ end of last complete line in block starting at <position> """
+        end = min(position + self.BLOCK_SIZE, self.size)
+        if end == self.size:
+            return end
+
+        line_end = self.mapped.rfind('\n', position, end)
+        if line_end < 0:
+            line_end = self.mapped.find('\n', end)
+        if line_end < 0:
+            return self.size
+        return line_end + 1
+
+    def _first_line(self):
+        line_end = self.mapped.find('\n')
+        if line_end < 0:
+            line_end = self.size
+        return self.mapped[:line_end]
+
+
+class BinaryReader(DataReader):
+    """
+    Binary recording reader
+
+    maps recording file and returns
+    windows as slices of mapped array
+    """
+
+    @staticmethod
+    def accepts(entry_file):
+        return is_recording(entry_file)
+
+    def start(self, entry_file, entry_frame):
+        self.window = int(entry_frame)
+        try:
+            self.recording = RecordingReader(entry_file)
+        except (IOError, ValueError):
+            return False
+
+        self.channels = self.recording.channels
+        self.discr = int(self.recording.rate) or self.DEFAULT_DISCR
+        self.row = 0
+        return True
+
+    def get(self):
+        batch, discr = self.get_batch(1)
+        if batch is None:
+            return None, discr
+        return batch[0], discr
+
+    def get_batch(self, number):
+        """ return up to <number> windows as (windows x lines x values) """
+        number = min(number, (len(self.recording)-self.row)//self.window)
+        if number < 1:
+            return None, self.discr
+
+        end = self.row + number*self.window
+        batch = self.recording.data[self.row:end].reshape(
+            number, self.window, self.channels
+            )
+        self.row = end
+        return batch, self.discr
+
+    def stop(self):
+        self.recording = None
@@ -19,3 +19,7 @@ class TCPErrorBrokenPackage(TCPError):
 
 class TCPErrorServerDisconnect(TCPError):
     ERRORMSG = "Client was disconnected by server"
+
+
+class BackendError(BaseError):
+    ERRORMSG = "Processing backend failed"
@@ -1,41 +1,199 @@
 #!/usr/bin/env python
 import sys
-import random
+import json
+import math
 import time
+
+import numpy as np
+
 import lib
+from recording import RecordingWriter
 
 
 class FileGenerator(object):
+    """
+    Input data generator
+
+    generates blocks of lines at once, optionally with
+    given correlation between values (electrodes)
+
+    public methods:
+    - run - write lines to file
+    - generate - make one text line
+    - generate_block - make (lines x values) array
+    - expected_spearman - Spearman indexes of correlated pairs
+    """
     SLEEP_TIME = 0.
+    BLOCK = 2**14
+    TICK = 0.05
+    FORMAT = "%.12g"
+    LOGISTIC_SCALE = 1.702
 
-    def __init__(self, filename):
+    def __init__(self, filename, binary=False, seed=None, correlation=None):
+        self.binary = binary
+        self.random = np.random.RandomState(seed)
+        self.correlation = correlation or dict()
         try:
-            self.man_file = open(filename, 'w')
+            self.man_file = open(filename, 'wb' if binary else 'w')
         except IOError:
             sys.exit(lib.errors[2].format(filename))
 
-    def run(self, number, sleep_time=SLEEP_TIME):
-        while True:
-            try:
-                string = self.generate(number)
-                self.man_file.write(string)
-                time.sleep(sleep_time)
-            except KeyboardInterrupt:
-                sys.exit(lib.errors[1])
+    def run(self, number, sleep_time=SLEEP_TIME, count=None, rate=None):
+        """
+        write <count> lines (endless if not set)
+        - sleep_time - time to idle between lines
+        - rate - lines pro second, overrides sleep_time
+        """
+        number = int(number)
+        mixing = self.mixing_matrix(number)
+        if self.binary:
+            self.recording = RecordingWriter(
+                self.man_file, number, rate=rate or 0.
+                )
+
+        if rate:
+            block = max(1, min(self.BLOCK, int(rate*self.TICK)))
+        elif sleep_time:
+            block = 1
+        else:
+            block = self.BLOCK
+
+        written = 0
+        start = time.time()
+        try:
+            while count is None or written < count:
+                lines = block if count is None else min(block, count-written)
+                self._write(self.generate_block(number, lines, mixing))
+                written += lines
+
+                if rate or sleep_time:
+                    """ let real time readers see new lines """
+                    self.man_file.flush()
+                if rate:
+                    """ keep schedule instead of sleeping fixed time """
+                    delay = start + written/float(rate) - time.time()
+                    if delay > 0:
+                        time.sleep(delay)
+                elif sleep_time:
+                    time.sleep(sleep_time)
+        except KeyboardInterrupt:
+            sys.exit(lib.errors[1])
+        finally:
+            self.man_file.flush()
+
+        return written
 
     def generate(self, number):
-        line = [str(random.random()) for x in range(int(number))]
-        return ' '.join(line) + '\n'
+        line = self.generate_block(int(number), 1)[0]
+        return ' '.join(self.FORMAT % x for x in line) + '\n'
 
+    def generate_block(self, number, lines, mixing=None):
+        """
+        make (lines x number) array of values in (0, 1);
+        correlated values are normal values mixed with <mixing>
+        matrix and squashed by logistic approximation of normal CDF,
+        which keeps their ranks
+        """
+        if mixing is None:
+            return self.random.random_sample((lines, number))
 
-if __name__ == '__main__':
-    arg_parser = lib.ArgParser(sys.argv[1:])
+        normal = np.dot(
+            self.random.standard_normal((lines, number)), mixing.T
+            )
+        return 1/(1+np.exp(-self.LOGISTIC_SCALE*normal))
+
+    def mixing_matrix(self, number):
+        """
+        Cholesky factor of correlation matrix
+        or None if values are independent
+        """
+        if not self.correlation:
+            return None
+
+        matrix = np.eye(number)
+        for (x, y), value in self.correlation.items():
+            matrix[x, y] = matrix[y, x] = value
+        try:
+            return np.linalg.cholesky(matrix)
+        except np.linalg.LinAlgError:
+            sys.exit(lib.errors[4])
+
+    def expected_spearman(self):
+        """ Spearman indexes of correlated normal values """
+        return dict(
+            (pair, 6/math.pi*math.asin(value/2.))
+            for pair, value in self.correlation.items()
+            )
+
+    def _write(self, values):
+        if self.binary:
+            self.recording.write(values)
+        else:
+            line = ' '.join([self.FORMAT]*values.shape[1]) + '\n'
+            self.man_file.write((line*len(values)) % tuple(values.flat))
+
+
+def parse_correlation(string, number=None):
+    """
+    parse "x-y:value,..." string to {(x, y): value},
+    ValueError is raised on wrong items and on values
+    out of first <number> ones
+    """
+    correlation = dict()
+    if not string:
+        return correlation
+
+    for item in string.split(','):
+        try:
+            pair, value = item.split(':')
+            x, y = pair.split('-')
+            x, y, value = int(x), int(y), float(value)
+        except ValueError:
+            raise ValueError(
+                "wrong item {!r}, x-y:value expected".format(item)
+                )
+
+        if number is not None and not (0 <= x < number and 0 <= y < number):
+            raise ValueError("pair {}-{} is out of {} values".format(
+                x, y, number
+                ))
+        if x == y or not -1 <= value <= 1:
+            raise ValueError("wrong correlation {}".format(item))
+        correlation[(x, y)] = value
+
+    return correlation
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = lib.ArgParser()
     arg_parser._initiate_params_file_gen()
-    if len(sys.argv) == 1:
+    if not argv:
         arg_parser.print_help()
         sys.exit()
 
-    arguments = arg_parser.parse_args(sys.argv[1:])
+    arguments = arg_parser.parse_args(argv)
+
+    try:
+        correlation = parse_correlation(
+            arguments.correlation, arguments.number
+            )
+    except ValueError as error:
+        arg_parser.error("argument --correlation: {}".format(error))
+
+    gen = FileGenerator(
+        arguments.filename, arguments.binary,
+        arguments.seed, correlation
+        )
+
+    if arguments.truth:
+        with open(arguments.truth, 'w') as truth_file:
+            json.dump([
+                [x, y, value]
+                for (x, y), value in sorted(gen.expected_spearman().items())
+                ], truth_file)
 
-    gen = FileGenerator(arguments.filename)
-    gen.run(arguments.number)
+    gen.run(arguments.number, arguments.sleep, arguments.count, arguments.rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,47 +4,20 @@ from __future__ import division
 import Tkinter as tk
 import tkMessageBox as tkmb
 import ttk
+import sys
 import math
 
+import lib
 from spearman import Model
+from lib import ELEMENTS_NAME
+from publisher import start_publisher
+from worker import LatestSlot, CalculationWorker
 
 tk.Entry.default = ""
 
 FONT = ("Arial", 12)
 CUSTOM_LEN = 29
 
-ELEMENTS_NAME = {
-    0: "FP1",
-    1: "F3",
-    2: "C3",
-    3: "P3",
-    4: "O1",
-    5: "F7",
-    6: "T3",
-    7: "T5",
-    8: "FZ",
-    9: "PZ",
-    10: "A1",
-    11: "FP2",
-    12: "F4",
-    13: "C4",
-    14: "P4",
-    15: "O2",
-    16: "F8",
-    17: "T4",
-    18: "T6",
-    19: "FPZ",
-    20: "CZ",
-    21: "OZ",
-    22: "E1",
-    23: "E2",
-    24: "E3",
-    25: "E4",
-    26: "-",
-    27: "brth",
-    28: "res",
-    }
-
 
 class MenuFrame(tk.Frame):
     """ custom Frame """
@@ -505,6 +478,12 @@ class Window(tk.Tk):
         frame.widgets["entry_frame"] = tk.Entry(frame, font=FONT)
         frame.widgets["entry_frame"].default = "10"
 
+        frame.widgets["label_stride"] = tk.Label(
+            frame, text="stride", font=FONT
+            )
+        frame.widgets["entry_stride"] = tk.Entry(frame, font=FONT)
+        frame.widgets["entry_stride"].default = "0"
+
         frame.widgets["label_host"].grid(
             row=0, column=0, columnspan=1, sticky=tk.W
             )
@@ -526,6 +505,13 @@ class Window(tk.Tk):
             row=2, column=1, columnspan=2, sticky=tk.W
             )
 
+        frame.widgets["label_stride"].grid(
+            row=3, column=0, columnspan=1, sticky=tk.W
+            )
+        frame.widgets["entry_stride"].grid(
+            row=3, column=1, columnspan=2, sticky=tk.W
+            )
+
     def _init_file_menu(self, frame):
         frame.widgets = dict()
         frame.widgets["label_file"] = tk.Label(
@@ -540,6 +526,12 @@ class Window(tk.Tk):
         frame.widgets["entry_frame"] = tk.Entry(frame, font=FONT)
         frame.widgets["entry_frame"].default = "10"
 
+        frame.widgets["label_stride"] = tk.Label(
+            frame, text="stride", font=FONT
+            )
+        frame.widgets["entry_stride"] = tk.Entry(frame, font=FONT)
+        frame.widgets["entry_stride"].default = "0"
+
         frame.widgets["label_file"].grid(
             row=0, column=0, columnspan=1, sticky=tk.W
             )
@@ -554,6 +546,13 @@ class Window(tk.Tk):
             row=1, column=1, columnspan=2, sticky=tk.W
             )
 
+        frame.widgets["label_stride"].grid(
+            row=2, column=0, columnspan=1, sticky=tk.W
+            )
+        frame.widgets["entry_stride"].grid(
+            row=2, column=1, columnspan=2, sticky=tk.W
+            )
+
     def _init_buttons(self, frame):
         frame.widgets = dict()
         self.btn_start = tk.Button(frame, text="start", font=FONT)
@@ -645,15 +644,27 @@ class Window(tk.Tk):
 
 
 class Presenter(object):
-    """Processing presenter"""
+    """
+    Processing presenter
+
+    calculation runs in background worker, view is
+    refreshed FRAME_RATE times pro second with the newest
+    result, results calculated between frames are skipped;
+    table is refreshed once pro TABLE_REFRESH_RATE lines
+    of calculated windows, skipped ones are counted too
+    """
 
     TABLE_REFRESH_RATE = 1000
+    FRAME_RATE = 25
 
-    def __init__(self):
+    def __init__(self, publisher=None):
         self.view = Window()
         self.model = Model()
+        self.publisher = publisher
+        self.worker = None
+        self.slot = None
         self.run_state = None
-        self.refresh_iter = 0
+        self.table_window = None
         self.excludion = list()
 
         self._bind_view_events()
@@ -673,13 +684,18 @@ class Presenter(object):
 
         self.view.event_start(event)
         self.run_state = True
-        self.refresh_iter = 0
+        self.table_window = None
         print("event start")
 
         start = self.start_spearman()
 
         if start:
-            self.view.after_idle(self.calculate_loop)
+            self.slot = LatestSlot()
+            self.worker = CalculationWorker(
+                self.model, self.slot, self.publisher
+                )
+            self.worker.start()
+            self.view.after_idle(self.refresh_loop)
         else:
             self.view.event_generate("<<Stop>>")
 
@@ -723,7 +739,11 @@ class Presenter(object):
 
     def run(self):
         """ start gui event loop """
-        self.view.mainloop()
+        try:
+            self.view.mainloop()
+        finally:
+            if self.publisher is not None:
+                self.publisher.stop()
 
     def start_spearman(self):
         """ prepare calculation core object """
@@ -735,15 +755,23 @@ class Presenter(object):
             )
 
         self.window = int(fields["entry_frame"])
+        """ sliding mode refreshes each <stride> lines """
+        stride = int(fields.get("entry_stride") or 0)
+        if 0 < stride < self.window:
+            self.window = stride
 
         if not result:
             self.view.msg_error("Error while connecting")
         return result
 
-    def calculate_loop(self):
-        """ calculate some data package (one iteration) """
-        full_dict, discr = self.model.calculate_loop()
-        if full_dict and self.run_state:
+    def refresh_loop(self):
+        """ draw the newest result (one frame) """
+        if not self.run_state:
+            return
+
+        result = self.slot.take()
+        if result is not None:
+            number, full_dict, discr = result
             self.key_array = full_dict["keys"]
             self.val_array = full_dict["kfs"]
 
@@ -751,18 +779,23 @@ class Presenter(object):
                 self.view.can, self.key_array, self.val_array
                 )
             self._refresh_table(
-                self.view.table, self.key_array, self.val_array, discr
+                self.view.table, self.key_array, self.val_array, number
                 )
             self._check_create(self.view.select_frame, self.key_array)
 
-            self.view.after_idle(self.calculate_loop)
-
-        elif self.run_state:
+        elif self.slot.finished():
             self.view.event_generate("<<Stop>>")
+            return
+
+        self.view.after(1000//self.FRAME_RATE, self.refresh_loop)
 
     def stop_spearman(self):
         """ stop calculation """
-        self.model.stop_spearman()
+        if self.worker is None:
+            self.model.stop_spearman()
+            return
+        self.worker.stop()
+        self.worker = None
 
     def _check_refresh(self, widget, number, data):
         """ renew and redraw widget in case new number of elements """
@@ -775,24 +808,25 @@ class Presenter(object):
             widget.clear()
             widget.create(number, excludion=self.excludion)
 
-    def _refresh_table(self, widget, number, data, discr):
+    def _refresh_table(self, widget, number, data, window_number):
         """
-        refresh table only one time pro several iterations
-        to prevert gui overload
+        refresh table only one time pro several calculated windows
+        to prevert gui overload; <window_number> is worker's counter
         """
-        refresh_fr = self.TABLE_REFRESH_RATE//self.window
+        refresh_fr = max(self.TABLE_REFRESH_RATE//self.window, 1)
 
-        if not self.refresh_iter:
+        if (self.table_window is None or
+                window_number - self.table_window > refresh_fr):
             self._check_refresh(widget, number, data)
+            self.table_window = window_number
 
-        if self.refresh_iter < refresh_fr:
-            self.refresh_iter += 1
-        else:
-            self.refresh_iter = 0
 
+def main(argv=sys.argv[1:]):
+    arg_parser = lib.ArgParser()
+    arg_parser._initiate_params_publish()
+    arguments = arg_parser.parse_args(argv)
 
-def main():
-    presenter = Presenter()
+    presenter = Presenter(start_publisher(arguments))
     presenter.run()
 
 
@@ -0,0 +1,209 @@
+#!/usr/bin/env python
+import sys
+import json
+import time
+import struct
+from timeit import default_timer
+
+import lib
+from spearman import Model
+from store import ResultsStore
+
+
+class JSONWriter(object):
+    """ write results as JSON lines """
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, number, full_dict, discr):
+        line = json.dumps({
+            "window": number,
+            "keys": full_dict["keys"],
+            "discr": discr,
+            "time": full_dict.get("time"),
+            "kfs": full_dict["kfs"].values(),
+            })
+        self.stream.write(line + '\n')
+
+
+class BinaryWriter(object):
+    """
+    write results as binary frames:
+    window number, channels number, discretization (little-endian int32)
+    and condensed float32 correlation indexes
+    """
+    HEADER = struct.Struct("<iii")
+
+    def __init__(self, stream):
+        self.stream = stream
+
+    def write(self, number, full_dict, discr):
+        self.stream.write(self.encode(number, full_dict, discr))
+
+    @classmethod
+    def encode(cls, number, full_dict, discr):
+        """ binary frame of one result """
+        return cls.HEADER.pack(
+            number, full_dict["keys"], int(discr or 0)
+            ) + full_dict["kfs"].values_array.astype("<f4").tostring()
+
+
+class HeadlessRunner(object):
+    """
+    Calculation without GUI
+
+    public methods:
+    - run - calculate all windows and write results
+    - report - print throughput statistics
+    """
+    FORMAT_JSON = "json"
+    FORMAT_BINARY = "binary"
+    WRITERS = {
+        FORMAT_JSON: JSONWriter,
+        FORMAT_BINARY: BinaryWriter,
+    }
+
+    def __init__(self, stream, out_format=FORMAT_JSON, backend=None,
+                 store=None, publisher=None):
+        self.model = Model(backend)
+        self.writer = self.WRITERS[out_format](stream)
+        self.publisher = publisher
+        self.store_path = store
+        self.store = None
+        self.windows = 0
+        self.samples = 0
+        self.seconds = 0.
+        self.metrics = None
+
+    def run(self, mode, **kwargs):
+        """ calculate until data source ends or user stops """
+        window = int(kwargs["entry_frame"])
+        stride = int(kwargs.get("entry_stride") or 0)
+        step = stride if 0 < stride < window else window
+
+        if not self.model.start_spearman(mode, **kwargs):
+            return False
+
+        start = default_timer()
+        try:
+            while True:
+                full_dict, discr = self.model.calculate_loop()
+                if not full_dict:
+                    break
+                self.writer.write(self.windows, full_dict, discr)
+                if self.store_path:
+                    self._store(full_dict)
+                if self.publisher is not None:
+                    self.publisher.publish(self.windows, full_dict, discr)
+                self.windows += 1
+                self.samples += step
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.seconds = default_timer() - start
+            self.metrics = self.model.metrics()
+            self.model.stop_spearman()
+            if self.store is not None:
+                self.store.close()
+
+        return True
+
+    def _store(self, full_dict):
+        """
+        append result to store, windows without
+        source time get time of calculation;
+        store keeps time order, so windows older
+        than the last stored one are skipped
+        """
+        if self.store is None:
+            self.store = ResultsStore(self.store_path, full_dict["keys"])
+        moment = full_dict.get("time")
+        if moment is None:
+            moment = max(time.time(), self.store.last_time)
+        if moment < self.store.last_time:
+            lib.Debugger.deb("window time {} is before stored {}, "
+                             "not stored".format(moment, self.store.last_time))
+            return
+        self.store.append(moment, full_dict["kfs"].values_array)
+
+    def report(self, stream=sys.stderr):
+        """ print throughput statistics """
+        seconds = self.seconds or float("nan")
+        stream.write(
+            "windows: {}\nsamples: {}\nseconds: {:.3f}\n"
+            "windows/s: {:.1f}\nsamples/s: {:.1f}\n".format(
+                self.windows, self.samples, self.seconds,
+                self.windows/seconds, self.samples/seconds
+                )
+            )
+        if self.metrics:
+            stream.write(
+                "policy: {policy}\nqueue depth: {depth}\nlag: {lag}\n"
+                "dropped: {dropped}\nmerged: {merged}\n".format(
+                    **self.metrics
+                    )
+                )
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = lib.ArgParser()
+    arg_parser._initiate_params_headless()
+    if not argv:
+        arg_parser.print_help()
+        sys.exit()
+
+    arguments = arg_parser.parse_args(argv)
+
+    kwargs = {
+        "entry_frame": arguments.frame,
+        "entry_stride": arguments.stride,
+        "entry_batch": arguments.batch,
+        "entry_channels": arguments.channels,
+        "entry_policy": arguments.policy,
+    }
+    if arguments.filename:
+        mode = Model.MODE_FILE
+        kwargs["entry_file"] = arguments.filename
+    else:
+        mode = Model.MODE_NET
+        kwargs["entry_host"] = arguments.host
+        kwargs["entry_port"] = arguments.port
+
+    if arguments.output == '-':
+        stream = sys.stdout
+    else:
+        try:
+            stream = open(arguments.output, 'wb')
+        except IOError:
+            sys.exit(lib.errors[2].format(arguments.output))
+
+    """ publisher module imports this one """
+    from publisher import start_publisher
+    publisher = start_publisher(arguments)
+
+    runner = HeadlessRunner(
+        stream, arguments.format, arguments.backend, arguments.store,
+        publisher
+        )
+    error = None
+    try:
+        status = runner.run(mode, **kwargs)
+    except ValueError as error:
+        """ broken input line, results before it are kept """
+        status = False
+    if publisher is not None:
+        publisher.stop()
+    stream.flush()
+    if stream is not sys.stdout:
+        stream.close()
+
+    if error is not None:
+        sys.exit(lib.errors[5].format(error))
+    if not status:
+        sys.exit(lib.errors[3])
+    runner.report()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,298 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+
+import numpy as np
+
+import lib
+from results import CorrelationResult
+from store import ResultsStore
+
+
+def summary_dtype(channels):
+    pairs = channels*(channels-1)//2
+    return np.dtype([
+        ("start", "<f8"), ("last", "<i8"), ("count", "<i8"),
+        ("sum", "<f8", (pairs,)),
+        ("min", "<f4", (pairs,)),
+        ("max", "<f4", (pairs,)),
+        ])
+
+
+class ResultsHistory(object):
+    """
+    Queries over results store
+
+    time ranges of records, columns of chosen channel pairs
+    and per bucket mean, min, max or percentile;
+    mean, min and max of long ranges are taken from summaries
+    of every minute and hour, kept in store directory
+    and updated with new records before every aggregation
+
+    pairs are (x, y) tuples of channel numbers or names
+    of lib.ELEMENTS_NAME, None means all pairs
+
+    public methods:
+    - pair_index - condensed array position of pair
+    - range - times and values of records in time range
+    - pair - times and values of one pair in time range
+    - aggregate - values per time bucket
+    - update - add new complete buckets to summaries
+    """
+    LEVELS = (60., 3600.)
+    SUMMARY_NAME = "summary_{:06d}.scs"
+    HOWS = ("mean", "min", "max", "percentile")
+    CHUNK = 2**14
+
+    def __init__(self, store):
+        if not isinstance(store, ResultsStore):
+            store = ResultsStore(store, readonly=True)
+        self.store = store
+        self.layout = CorrelationResult(store.channels)
+        self.names = dict(
+            (name, number) for number, name in lib.ELEMENTS_NAME.items()
+            if number < store.channels
+            )
+        self.dtype = summary_dtype(store.channels)
+
+    def pair_index(self, x, y):
+        """ condensed array position of (x, y) pair """
+        return self.layout.index(self.names.get(x, x), self.names.get(y, y))
+
+    def range(self, start_time=None, end_time=None, pairs=None):
+        """ times and values of records with start_time <= time < end_time """
+        start = 0 if start_time is None else self.store.find(start_time)
+        stop = None if end_time is None else self.store.find(end_time)
+        times, values = self.store.read(start, stop)
+        return times, self._columns(values, pairs)
+
+    def pair(self, x, y, start_time=None, end_time=None):
+        """ times and values of (x, y) pair in time range """
+        times, values = self.range(start_time, end_time, [(x, y)])
+        return times, values[:, 0]
+
+    def aggregate(self, start_time, end_time, bucket, how="mean",
+                  pairs=None, percent=50):
+        """
+        (bucket starts, values) of buckets aligned to multiples
+        of <bucket> seconds and clipped to time range;
+        buckets without records are NaN
+        """
+        if how not in self.HOWS:
+            raise ValueError("unknown aggregation {}".format(how))
+
+        starts = np.arange(
+            np.floor(start_time/bucket)*bucket, end_time, bucket
+            )
+        columns = self._indexes(pairs)
+        result = np.empty((len(starts), len(columns)))
+        result.fill(np.nan)
+
+        levels = list()
+        if how != "percentile":
+            self.update()
+            levels = [
+                (width, self._summary(width)) for width in self.LEVELS[::-1]
+                if bucket >= width and bucket % width == 0
+                ]
+
+        for number, first in enumerate(starts):
+            low = max(first, start_time)
+            high = min(first + bucket, end_time)
+            rows = None
+            if low == first and high == first + bucket:
+                rows = self._summary_rows(levels, low, high)
+            if rows is not None:
+                result[number] = self._reduce_summary(rows, columns, how)
+            else:
+                result[number] = self._reduce_records(
+                    low, high, columns, how, percent
+                    )
+
+        return starts, result
+
+    def update(self):
+        """ add new complete buckets of every level to summaries """
+        if not os.access(self.store.path, os.W_OK):
+            return
+
+        for level, width in enumerate(self.LEVELS):
+            summary = self._summary(width)
+            position = int(summary["last"][-1]) if len(summary) else 0
+            if level == 0:
+                rows = self._summarize_records(position, width)
+            else:
+                rows = self._summarize_rows(
+                    self._summary(self.LEVELS[level-1]), position, width
+                    )
+            if len(rows):
+                with open(self._summary_path(width), 'ab') as summary_file:
+                    """ torn row of interrupted update is cut off first """
+                    summary_file.truncate(len(summary)*self.dtype.itemsize)
+                    summary_file.write(rows.tostring())
+
+    def _indexes(self, pairs):
+        if pairs is None:
+            return np.arange(len(self.layout))
+        return np.array([self.pair_index(x, y) for x, y in pairs], dtype=int)
+
+    def _columns(self, values, pairs):
+        if pairs is None:
+            return values
+        return values[:, self._indexes(pairs)]
+
+    def _summary_path(self, width):
+        return os.path.join(
+            self.store.path, self.SUMMARY_NAME.format(int(width))
+            )
+
+    def _summary(self, width):
+        """ summary rows of level, torn last row is ignored """
+        path = self._summary_path(width)
+        if not os.path.exists(path):
+            return np.zeros(0, dtype=self.dtype)
+        number = os.path.getsize(path)//self.dtype.itemsize
+        if not number:
+            return np.zeros(0, dtype=self.dtype)
+        return np.memmap(path, dtype=self.dtype, mode='r', shape=(number,))
+
+    def _summary_rows(self, levels, low, high):
+        """ rows of the widest level covering whole [low, high) bucket """
+        for width, summary in levels:
+            if not len(summary) or summary["start"][-1] + width < high:
+                continue
+            first, last = np.searchsorted(summary["start"], (low, high))
+            return summary[first:last]
+        return None
+
+    def _reduce_summary(self, rows, columns, how):
+        count = rows["count"].sum()
+        if not count:
+            return np.nan
+        if how == "mean":
+            return rows["sum"][:, columns].sum(axis=0)/count
+        if how == "min":
+            return rows["min"][:, columns].min(axis=0)
+        return rows["max"][:, columns].max(axis=0)
+
+    def _reduce_records(self, low, high, columns, how, percent):
+        values = self.store.read(
+            self.store.find(low), self.store.find(high)
+            )[1][:, columns]
+        if not len(values):
+            return np.nan
+        if how == "mean":
+            return values.mean(axis=0, dtype=np.float64)
+        if how == "min":
+            return values.min(axis=0)
+        if how == "max":
+            return values.max(axis=0)
+        return np.percentile(values, percent, axis=0)
+
+    def _summarize_records(self, position, width):
+        """ summary rows of complete buckets of records from <position> """
+        result = list()
+        total = len(self.store)
+        size = self.CHUNK
+        while position < total:
+            times, values = self.store.read(position, position + size)
+            rows = self._group(
+                times, np.ones(len(times), dtype=np.int64),
+                values.astype(np.float64), values, values, position, width
+                )
+            if not len(rows):
+                if position + size >= total:
+                    break
+                """ bucket is longer than chunk """
+                size *= 2
+                continue
+            result.append(rows)
+            position = int(rows["last"][-1])
+        return self._join(result)
+
+    def _summarize_rows(self, source, position, width):
+        """ summary rows of complete buckets of lower level rows """
+        source = source[position:]
+        return self._group(
+            source["start"], source["count"], source["sum"],
+            source["min"], source["max"], position, width
+            )
+
+    def _group(self, starts, counts, sums, mins, maxs, position, width):
+        """
+        join source rows to buckets of <width> seconds,
+        last bucket is left until source rows after it appear
+        """
+        buckets = np.floor(np.asarray(starts)/width)
+        edges = np.flatnonzero(np.diff(buckets)) + 1
+        if not len(edges):
+            return np.zeros(0, dtype=self.dtype)
+
+        firsts = np.concatenate(([0], edges[:-1]))
+        rows = np.zeros(len(firsts), dtype=self.dtype)
+        rows["start"] = buckets[firsts]*width
+        rows["last"] = position + edges
+        rows["count"] = np.add.reduceat(counts[:edges[-1]], firsts)
+        rows["sum"] = np.add.reduceat(sums[:edges[-1]], firsts)
+        rows["min"] = np.minimum.reduceat(mins[:edges[-1]], firsts)
+        rows["max"] = np.maximum.reduceat(maxs[:edges[-1]], firsts)
+        return rows
+
+    def _join(self, parts):
+        if not parts:
+            return np.zeros(0, dtype=self.dtype)
+        return np.concatenate(parts)
+
+
+def parse_time(value, latest):
+    """ epoch seconds, negative values are relative to latest record """
+    if value is None:
+        return None
+    value = float(value)
+    return latest + value if value <= 0 else value
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = lib.ArgParser()
+    arg_parser._initiate_params_history()
+    if not argv:
+        arg_parser.print_help()
+        sys.exit()
+
+    arguments = arg_parser.parse_args(argv)
+
+    try:
+        history = ResultsHistory(arguments.store)
+    except (IOError, OSError, ValueError):
+        sys.exit(lib.errors[2].format(arguments.store))
+
+    if not len(history.store):
+        return
+    latest = history.store.last_time
+    start_time = parse_time(arguments.start, latest)
+    end_time = parse_time(arguments.end, latest)
+    pairs = None
+    if arguments.pairs:
+        pairs = [tuple(
+            int(name) if name.isdigit() else name for name in pair.split(',')
+            ) for pair in arguments.pairs]
+
+    if arguments.bucket:
+        if start_time is None:
+            start_time = history.store.read(0, 1)[0][0]
+        if end_time is None:
+            end_time = np.nextafter(latest, np.inf)
+        times, values = history.aggregate(
+            start_time, end_time, arguments.bucket, arguments.how,
+            pairs, arguments.percent
+            )
+    else:
+        times, values = history.range(start_time, end_time, pairs)
+
+    for moment, line in zip(times.tolist(), values.tolist()):
+        sys.stdout.write(json.dumps({"time": moment, "kfs": line}) + '\n')
+
+
+if __name__ == '__main__':
+    main()
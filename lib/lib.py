@@ -5,9 +5,44 @@ import sys
 
 INNER_SOCKET = ("127.0.0.1", 8000)
 
+ELEMENTS_NAME = {
+    0: "FP1",
+    1: "F3",
+    2: "C3",
+    3: "P3",
+    4: "O1",
+    5: "F7",
+    6: "T3",
+    7: "T5",
+    8: "FZ",
+    9: "PZ",
+    10: "A1",
+    11: "FP2",
+    12: "F4",
+    13: "C4",
+    14: "P4",
+    15: "O2",
+    16: "F8",
+    17: "T4",
+    18: "T6",
+    19: "FPZ",
+    20: "CZ",
+    21: "OZ",
+    22: "E1",
+    23: "E2",
+    24: "E3",
+    25: "E4",
+    26: "-",
+    27: "brth",
+    28: "res",
+}
+
 errors = {
     1: "\nGeneration concluded by user\n",
-    2: "\nError while open {}\n"
+    2: "\nError while open {}\n",
+    3: "\nError while connecting to data source\n",
+    4: "\nWrong correlation structure\n",
+    5: "\nWrong input data: {}\n"
 }
 
 json_example = {
@@ -49,6 +84,36 @@ class ArgParser(argparse.ArgumentParser):
             dest="sleep", type=float, default=0.,
             help="time to idle between iterations"
             )
+        self.add_argument(
+            "-b", "--binary",
+            dest="binary", action="store_true",
+            help="write binary recording instead of text"
+            )
+        self.add_argument(
+            "-c", "--count",
+            dest="count", type=int,
+            help="number of lines to write (endless if not set)"
+            )
+        self.add_argument(
+            "-r", "--rate",
+            dest="rate", type=float,
+            help="lines pro second to write in real time"
+            )
+        self.add_argument(
+            "--seed",
+            dest="seed", type=int,
+            help="random generator seed"
+            )
+        self.add_argument(
+            "--correlation",
+            dest="correlation",
+            help="correlated values: x-y:value,... e.g. 0-1:0.9,2-5:-0.5"
+            )
+        self.add_argument(
+            "-t", "--truth",
+            dest="truth",
+            help="path to JSON file for expected Spearman indexes"
+            )
 
     def _initiate_params_reader(self):
         """initiate default parameters"""
@@ -63,6 +128,275 @@ class ArgParser(argparse.ArgumentParser):
             help="number of values in line"
             )
 
+    def _initiate_params_headless(self):
+        """initiate default parameters"""
+        source = self.add_mutually_exclusive_group(required=True)
+        source.add_argument(
+            "-f", "--file-name",
+            dest="filename",
+            help="path to input file"
+            )
+        source.add_argument(
+            "-H", "--host",
+            dest="host",
+            help="NMCServer host"
+            )
+        self.add_argument(
+            "-p", "--port",
+            dest="port", type=int, default=8000,
+            help="NMCServer port"
+            )
+        self.add_argument(
+            "-w", "--window",
+            dest="frame", type=int, default=10,
+            help="number of lines in window"
+            )
+        self.add_argument(
+            "-s", "--stride",
+            dest="stride", type=int, default=0,
+            help="lines between sliding windows (0 - no overlap)"
+            )
+        self.add_argument(
+            "-b", "--batch",
+            dest="batch", type=int, default=1,
+            help="number of windows calculated at once"
+            )
+        self.add_argument(
+            "-n", "--number-of-values",
+            dest="channels", type=int, default=0,
+            help="number of values in line (used for backend tune)"
+            )
+        self.add_argument(
+            "-B", "--backend",
+            dest="backend", default="auto",
+            help="processing backend: auto, tune, cuda, matrix, pool, emulator"
+            )
+        self.add_argument(
+            "-P", "--policy",
+            dest="policy", default="decimate",
+            choices=("drop", "decimate", "batch", "block"),
+            help="NMCServer overflow policy"
+            )
+        self.add_argument(
+            "-o", "--output",
+            dest="output", default="-",
+            help="path to output file (- for stdout)"
+            )
+        self.add_argument(
+            "-F", "--format",
+            dest="format", choices=("json", "binary"), default="json",
+            help="output format"
+            )
+        self.add_argument(
+            "--store",
+            dest="store", default=None,
+            help="directory of results store to append results to"
+            )
+        self._initiate_params_publish()
+
+    def _initiate_params_publish(self):
+        """initiate default parameters"""
+        self.add_argument(
+            "--publish",
+            dest="publish", default=None,
+            help="publish binary results to TCP subscribers on [host:]port"
+            )
+        self.add_argument(
+            "--publish-queue",
+            dest="publish_queue", type=int, default=64,
+            help="frames queued for one subscriber"
+            )
+        self.add_argument(
+            "--publish-policy",
+            dest="publish_policy", default="drop_oldest",
+            choices=("drop_oldest", "disconnect"),
+            help="what to do with subscriber when its queue is full"
+            )
+
+    def _initiate_params_benchmark(self):
+        """initiate default parameters"""
+        self.add_argument(
+            "-o", "--output",
+            dest="output", default="benchmark.json",
+            help="path to output file"
+            )
+        self.add_argument(
+            "-c", "--compare",
+            dest="compare",
+            help="path to previous output file to compare with"
+            )
+        self.add_argument(
+            "-n", "--number-of-values",
+            dest="channels", type=int, nargs="+",
+            help="numbers of values in line"
+            )
+        self.add_argument(
+            "-w", "--window",
+            dest="windows", type=int, nargs="+",
+            help="window sizes"
+            )
+        self.add_argument(
+            "-s", "--seed",
+            dest="seed", type=int, default=0,
+            help="random generator seed"
+            )
+
+    def _initiate_params_recording(self):
+        """initiate default parameters"""
+        self.add_argument(
+            "source",
+            help="path to input file (text or binary recording)"
+            )
+        self.add_argument(
+            "target",
+            help="path to output file"
+            )
+        self.add_argument(
+            "-d", "--dtype",
+            dest="dtype", choices=("int16", "float32", "float64"),
+            default="float32",
+            help="binary values type"
+            )
+        self.add_argument(
+            "-r", "--rate",
+            dest="rate", type=float, default=0.,
+            help="sample rate, lines pro second"
+            )
+        self.add_argument(
+            "-c", "--channels",
+            dest="names",
+            help="comma separated channel names"
+            )
+
+    def _initiate_params_server(self):
+        """initiate default parameters"""
+        self.add_argument(
+            "-f", "--file-name",
+            dest="filename",
+            help="path to recording or text file (synthetic data if not set)"
+            )
+        self.add_argument(
+            "-H", "--host",
+            dest="host", default="127.0.0.1",
+            help="address to listen on"
+            )
+        self.add_argument(
+            "-p", "--port",
+            dest="port", type=int, default=8000,
+            help="port to listen on"
+            )
+        self.add_argument(
+            "-r", "--rate",
+            dest="rate", type=int,
+            help="sample rate, lines pro second (recording rate if not set)"
+            )
+        self.add_argument(
+            "-x", "--speed",
+            dest="speed", type=float, default=1.,
+            help="replay speed, 1 to 100 times real time"
+            )
+        self.add_argument(
+            "-S", "--scale",
+            dest="scale", type=float, default=1000.,
+            help="multiplier for non-integer values"
+            )
+        self.add_argument(
+            "--loop",
+            dest="loop", action="store_true",
+            help="replay file again when it ends"
+            )
+        self.add_argument(
+            "--seed",
+            dest="seed", type=int,
+            help="random generator seed for synthetic data"
+            )
+
+    def _initiate_params_multi_client(self):
+        """initiate default parameters"""
+        self.add_argument(
+            "-S", "--server",
+            dest="servers", action="append", required=True,
+            help="NMCServer address host:port, may be repeated"
+            )
+        self.add_argument(
+            "-w", "--window",
+            dest="frame", type=int, default=24,
+            help="number of lines in window"
+            )
+        self.add_argument(
+            "-B", "--backend",
+            dest="backend", default="matrix",
+            help="processing backend: auto, tune, cuda, matrix, pool, emulator"
+            )
+        self.add_argument(
+            "-o", "--output",
+            dest="output", default="-",
+            help="path to output file (- for stdout)"
+            )
+
+    def _initiate_params_sessions(self):
+        """initiate default parameters"""
+        self.add_argument(
+            "sessions", nargs="+",
+            help="session source[,window[,stride]]; "
+                 "source is input file or NMCServer host:port"
+            )
+        self.add_argument(
+            "-j", "--workers",
+            dest="workers", type=int, default=0,
+            help="number of calculation threads (CPU number by default)"
+            )
+        self.add_argument(
+            "-B", "--backend",
+            dest="backend", default="auto",
+            help="processing backend: auto, tune, cuda, matrix, pool, emulator"
+            )
+        self.add_argument(
+            "-o", "--output",
+            dest="output", default="-",
+            help="path to output file (- for stdout)"
+            )
+
+    def _initiate_params_history(self):
+        """initiate default parameters"""
+        self.add_argument(
+            "store",
+            help="results store directory"
+            )
+        self.add_argument(
+            "-p", "--pair",
+            dest="pairs", action="append", default=[],
+            help="channel pair x,y by number or name (FP1,O2), "
+                 "may be repeated; all pairs by default"
+            )
+        self.add_argument(
+            "-s", "--start",
+            dest="start", default=None,
+            help="range start, epoch seconds or seconds before last record "
+                 "(-3600)"
+            )
+        self.add_argument(
+            "-e", "--end",
+            dest="end", default=None,
+            help="range end, epoch seconds or seconds before last record"
+            )
+        self.add_argument(
+            "-b", "--bucket",
+            dest="bucket", type=float, default=0,
+            help="aggregate records per bucket of given seconds"
+            )
+        self.add_argument(
+            "-a", "--aggregate",
+            dest="how", default="mean",
+            choices=("mean", "min", "max", "percentile"),
+            help="bucket aggregation"
+            )
+        self.add_argument(
+            "-q", "--percent",
+            dest="percent", type=float, default=50,
+            help="percentile of percentile aggregation"
+            )
+
 
 class Debugger(object):
     """ simple crossprocessing debugger"""
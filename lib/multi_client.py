@@ -0,0 +1,239 @@
+#!/usr/bin/env python
+import sys
+import json
+import select
+import socket
+import asyncore
+
+import numpy as np
+
+import lib
+import errors
+from tcp_client import SpearmanSocketListener
+from spearman import Spearman, REGISTRY, Model
+
+
+class StreamConnection(asyncore.dispatcher):
+    """
+    One NMCServer connection of MultiClient
+
+    uses TCPCLient framing and SpearmanSocketListener
+    frame decoding over non-blocking socket;
+    consumer gets (name, block, discr) for every decoded block
+    and (name, None, None) when connection is closed
+    """
+
+    def __init__(self, name, host, port, consumer, socket_map):
+        asyncore.dispatcher.__init__(self, map=socket_map)
+        self.name = name
+        self.consumer = consumer
+        self.finished = False
+
+        self.listener = SpearmanSocketListener(host, port, clients=dict())
+        """ blocking socket of listener is replaced by non-blocking one """
+        self.listener.disconnect()
+        self.create_socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.tcp_client.socket = self.socket
+        self.connect((host, port))
+
+    @property
+    def clients(self):
+        """ other clients registered on server """
+        return self.listener.tcp_client.clients
+
+    def handle_connect(self):
+        self.listener.register()
+
+    def handle_read(self):
+        try:
+            self.listener.receive()
+            for block in self.listener.ready_blocks():
+                self.consumer(self.name, block, self.listener.get_discr())
+        except errors.TCPErrorServerDisconnect:
+            self.finish()
+
+    def handle_close(self):
+        self.finish()
+
+    def handle_error(self):
+        lib.Debugger.deb("stream {}: {}".format(self.name, sys.exc_info()[1]))
+        self.finish()
+
+    def writable(self):
+        """ only connection result is waited for writing """
+        return not self.connected
+
+    def finish(self):
+        """ close connection and notify consumer once """
+        if self.finished:
+            return
+        self.finished = True
+        self.close()
+        self.consumer(self.name, None, None)
+
+
+class MultiClient(object):
+    """
+    Many NMCServer connections in one process
+
+    all connections are served by one asyncore event loop;
+    asyncio is not available in python 2
+
+    public methods:
+    - add - connect to server as stream <name>
+    - remove - close stream connection
+    - poll - handle ready connections once
+    - run - handle connections until all of them are closed
+    - close - close all connections
+    """
+    TIMEOUT = 0.1
+    USE_POLL = hasattr(select, "poll")
+
+    def __init__(self, consumer):
+        self.consumer = consumer
+        self.socket_map = dict()
+        self.streams = dict()
+
+    def add(self, name, host, port):
+        if name in self.streams:
+            raise ValueError("stream {} already exists".format(name))
+        self.streams[name] = StreamConnection(
+            name, host, port, self.consumer, self.socket_map
+            )
+
+    def remove(self, name):
+        self.streams.pop(name).finish()
+
+    def poll(self, timeout=TIMEOUT):
+        asyncore.loop(
+            timeout, use_poll=self.USE_POLL, map=self.socket_map, count=1
+            )
+
+    def run(self):
+        """ handle connections until all of them are closed """
+        try:
+            while self.socket_map:
+                self.poll()
+        except KeyboardInterrupt:
+            self.close()
+
+    def close(self):
+        for name in self.streams.keys():
+            self.remove(name)
+
+
+class WindowCollector(object):
+    """
+    MultiClient consumer
+
+    cuts decoded blocks of every stream to windows,
+    calculates Spearman indexes and passes them to
+    callback(name, number, full_dict, discr);
+    close gives processing backend back
+    """
+
+    def __init__(self, window, callback, backend=Model.BACKEND_MATRIX):
+        self.window = window
+        self.callback = callback
+        self.core = Spearman()
+        self.core.set_global(window)
+        if backend == Model.BACKEND_AUTO:
+            backend = REGISTRY.choose(
+                SpearmanSocketListener.ARRAYS_NUMBER, window
+                )
+        elif backend == Model.BACKEND_TUNE:
+            backend = REGISTRY.autotune(
+                SpearmanSocketListener.ARRAYS_NUMBER, window
+                )
+        self.backend = backend
+        self.manager = REGISTRY.create(backend)
+        self.pending = dict()
+        self.windows = dict()
+
+    def __call__(self, name, block, discr):
+        if block is None:
+            self.pending.pop(name, None)
+            return
+
+        lines = self.pending.get(name)
+        lines = block if lines is None else np.concatenate((lines, block))
+        start = 0
+        while len(lines) - start >= self.window:
+            window = lines[start:start+self.window]
+            start += self.window
+            full_dict = self.core.process(
+                self.manager, self.core.make_full_list(window)
+                )
+            number = self.windows.get(name, 0)
+            self.windows[name] = number + 1
+            self.callback(name, number, full_dict, discr)
+        self.pending[name] = lines[start:]
+
+    def close(self):
+        if self.manager is not None:
+            REGISTRY.release(self.backend)
+        self.manager = None
+
+
+def parse_server(string):
+    """ parse "host:port" string """
+    host, port = string.rsplit(':', 1)
+    return host, int(port)
+
+
+def stream_names(servers):
+    """
+    (name, address) of every server, repeated address
+    gets number of its connection: host:port#2
+    """
+    seen = dict()
+    for server in servers:
+        seen[server] = seen.get(server, 0) + 1
+        if seen[server] == 1:
+            yield server, server
+        else:
+            yield "{}#{}".format(server, seen[server]), server
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = lib.ArgParser()
+    arg_parser._initiate_params_multi_client()
+    if not argv:
+        arg_parser.print_help()
+        sys.exit()
+
+    arguments = arg_parser.parse_args(argv)
+
+    if arguments.output == '-':
+        stream = sys.stdout
+    else:
+        try:
+            stream = open(arguments.output, 'w')
+        except IOError:
+            sys.exit(lib.errors[2].format(arguments.output))
+
+    def write(name, number, full_dict, discr):
+        stream.write(json.dumps({
+            "stream": name,
+            "window": number,
+            "keys": full_dict["keys"],
+            "discr": discr,
+            "kfs": full_dict["kfs"].values(),
+            }) + '\n')
+
+    collector = WindowCollector(arguments.frame, write, arguments.backend)
+    client = MultiClient(collector)
+    try:
+        for name, server in stream_names(arguments.servers):
+            client.add(name, *parse_server(server))
+        client.run()
+    finally:
+        collector.close()
+
+    stream.flush()
+    if stream is not sys.stdout:
+        stream.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+import sys
+import time
+import struct
+import socket
+import datetime
+import threading
+import SocketServer
+
+import numpy as np
+
+import lib
+import datamanagers as dm
+from tcp_client import TCPCLient, SpearmanSocketListener
+
+
+class FrameSource(object):
+    """
+    Source of data frames for NMCServer simulator
+
+    replays binary recording or text file,
+    or generates synthetic data if no file given
+
+    public methods:
+    - next_block - next (ARRAY_ELEMENTS x ARRAYS_NUMBER) int16 block
+    """
+    ARRAYS_NUMBER = SpearmanSocketListener.ARRAYS_NUMBER
+    ARRAY_ELEMENTS = SpearmanSocketListener.ARRAY_ELEMENTS
+    SCALE = 1000
+    INT16 = np.iinfo(np.int16)
+
+    def __init__(self, filename=None, loop=False, scale=SCALE, seed=None):
+        self.filename = filename
+        self.loop = loop
+        self.scale = scale
+        self.reader = None
+        self.random = np.random.RandomState(seed)
+        if filename:
+            self._open()
+
+    def _open(self):
+        if dm.BinaryReader.accepts(self.filename):
+            self.reader = dm.BinaryReader()
+        else:
+            self.reader = dm.MappedFileReader()
+        if not self.reader.start(self.filename, self.ARRAY_ELEMENTS):
+            raise IOError(lib.errors[2].format(self.filename))
+
+    def next_block(self):
+        """ next block of lines or None when source ends """
+        if not self.filename:
+            return self._to_int16(self.random.random_sample(
+                (self.ARRAY_ELEMENTS, self.ARRAYS_NUMBER)
+                ))
+
+        block, discr = self.reader.get()
+        if block is None and self.loop:
+            self.reader.stop()
+            self._open()
+            block, discr = self.reader.get()
+        if block is None:
+            return None
+        return self._to_int16(block)
+
+    def rate(self):
+        """ sample rate of recording or None if unknown """
+        if isinstance(self.reader, dm.BinaryReader):
+            return int(self.reader.recording.rate) or None
+        return None
+
+    def _to_int16(self, block):
+        """ fit block to frame size and values type """
+        block = np.asarray(block)
+        if block.dtype != np.int16:
+            block = np.clip(
+                np.rint(block*self.scale), self.INT16.min, self.INT16.max
+                )
+
+        result = np.zeros(
+            (self.ARRAY_ELEMENTS, self.ARRAYS_NUMBER), dtype=np.int16
+            )
+        channels = min(block.shape[1], self.ARRAYS_NUMBER)
+        result[:, :channels] = block[:, :channels]
+        return result
+
+
+class NMCServer(SocketServer.ThreadingTCPServer):
+    """
+    NMCServer simulator
+
+    registers clients, notifies them about other clients,
+    polls them and broadcasts type 6 data frames
+    with <rate> lines pro second multiplied by <speed>
+
+    public methods:
+    - start - start broadcasting in background thread
+    - stop - disconnect clients and stop server
+    """
+    daemon_threads = True
+    allow_reuse_address = True
+
+    FRAME_HEADER = struct.Struct("<i8h8h28xi")
+    CLIENT_HEADER = struct.Struct("<ii")
+    CLIENT_INFO = struct.Struct("<iiii")
+    SERVER_NUMBER = 1
+    POLL_INTERVAL = 1.
+    RATE = 1000
+    MAX_SPEED = 100.
+
+    def __init__(self, address, source, rate=RATE, speed=1.):
+        SocketServer.ThreadingTCPServer.__init__(
+            self, address, ClientHandler
+            )
+        self.source = source
+        self.rate = int(rate)
+        self.speed = min(max(speed, 1.), self.MAX_SPEED)
+        self.clients = dict()
+        self.clients_lock = threading.Lock()
+        self.next_number = self.SERVER_NUMBER + 1
+        self.frames = 0
+        self.running = False
+        self.client_joined = threading.Event()
+
+    def start(self):
+        """ start accepting clients and broadcasting frames """
+        self.running = True
+        for target in (self.serve_forever, self.broadcast_loop):
+            thread = threading.Thread(target=target)
+            thread.daemon = True
+            thread.start()
+
+    def stop(self):
+        """ send disconnect command to all clients and stop server """
+        self.running = False
+        self.send_all(self.server_command(0))
+        self.shutdown()
+        self.server_close()
+
+    def add_client(self, handler, name):
+        """ register client and notify all clients about each other """
+        with self.clients_lock:
+            number = self.next_number
+            self.next_number += 1
+            others = self.clients.items()
+            self.clients[number] = (name, handler)
+        self.client_joined.set()
+
+        for other_number, (other_name, other) in others:
+            handler.send(self.server_command(1, other_number, other_name))
+            other.send(self.server_command(1, number, name))
+
+        return number
+
+    def remove_client(self, number):
+        """ forget client and notify others """
+        with self.clients_lock:
+            name, handler = self.clients.pop(number, (None, None))
+        if name is not None:
+            self.send_all(self.server_command(-1, number, name))
+
+    def send_all(self, message):
+        with self.clients_lock:
+            handlers = [handler for name, handler in self.clients.values()]
+        for handler in handlers:
+            handler.send(message)
+
+    def broadcast_loop(self):
+        """
+        send frames to all clients keeping real time schedule,
+        replay starts when first client registers
+        """
+        while self.running and not self.client_joined.wait(self.POLL_INTERVAL):
+            pass
+
+        frame_lines = FrameSource.ARRAY_ELEMENTS
+        period = frame_lines/float(self.rate*self.speed)
+        start = time.time()
+        next_poll = start + self.POLL_INTERVAL
+        clock = datetime.datetime.now()
+
+        while self.running:
+            block = self.source.next_block()
+            if block is None:
+                break
+
+            end_clock = clock + datetime.timedelta(
+                seconds=(frame_lines-1)/float(self.rate)
+                )
+            self.send_all(self.client_message(
+                self.data_frame(block, clock, end_clock)
+                ))
+            clock = end_clock + datetime.timedelta(seconds=1./self.rate)
+            self.frames += 1
+
+            now = time.time()
+            if now >= next_poll:
+                self.send_all(self.server_command(TCPCLient.POLL))
+                next_poll = now + self.POLL_INTERVAL
+
+            delay = start + self.frames*period - time.time()
+            if delay > 0:
+                time.sleep(delay)
+
+        self.running = False
+
+    def data_frame(self, block, time_begin, time_end):
+        """ make type 6 frame of (ARRAY_ELEMENTS x ARRAYS_NUMBER) block """
+        header = self.FRAME_HEADER.pack(
+            SpearmanSocketListener.FRAME_TYPE,
+            *(system_time(time_begin) + system_time(time_end) + [self.rate])
+            )
+        return header + block.T.astype("<i2").tostring()
+
+    def client_message(self, payload):
+        return self.CLIENT_HEADER.pack(
+            self.SERVER_NUMBER, len(payload)
+            ) + payload
+
+    def server_command(self, command, number=None, name=None):
+        if number is None:
+            return self.CLIENT_HEADER.pack(0, command)
+
+        uni_name = name.encode("utf-16-le")
+        return self.CLIENT_INFO.pack(
+            0, command, number, len(uni_name)//2
+            ) + uni_name
+
+
+class ClientHandler(SocketServer.BaseRequestHandler):
+    """ one client connection of NMCServer simulator """
+
+    def setup(self):
+        self.send_lock = threading.Lock()
+        self.alive = True
+
+    def handle(self):
+        name = self._read_name()
+        if name is None:
+            return
+        number = self.server.add_client(self, name)
+
+        """ wait until client disconnects """
+        try:
+            while self.alive and self.request.recv(TCPCLient.MAX_TCP_SIZE):
+                pass
+        except socket.error:
+            pass
+        finally:
+            self.alive = False
+            self.server.remove_client(number)
+
+    def send(self, message):
+        if not self.alive:
+            return
+        try:
+            with self.send_lock:
+                self.request.sendall(message)
+        except socket.error:
+            self.alive = False
+
+    def _read_name(self):
+        """ read client registration: name length and utf-16 name """
+        length = self._recv_exactly(4)
+        if length is None:
+            return None
+        name = self._recv_exactly(2*struct.unpack("<i", length)[0])
+        if name is None:
+            return None
+        return name.decode("utf-16-le")
+
+    def _recv_exactly(self, size):
+        data = ''
+        while len(data) < size:
+            try:
+                chunk = self.request.recv(size-len(data))
+            except socket.error:
+                return None
+            if not chunk:
+                return None
+            data += chunk
+        return data
+
+
+def system_time(moment):
+    """ SYSTEMTIME-like list of 8 short values """
+    return [
+        moment.year, moment.month, moment.isoweekday() % 7, moment.day,
+        moment.hour, moment.minute, moment.second,
+        moment.microsecond//1000
+    ]
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = lib.ArgParser()
+    arg_parser._initiate_params_server()
+    arguments = arg_parser.parse_args(argv)
+
+    try:
+        source = FrameSource(
+            arguments.filename, arguments.loop, arguments.scale, arguments.seed
+            )
+    except IOError as error:
+        sys.exit(str(error))
+
+    server = NMCServer(
+        (arguments.host, arguments.port), source,
+        arguments.rate or source.rate() or NMCServer.RATE, arguments.speed
+        )
+    server.start()
+    lib.Debugger.deb("NMCServer simulator listens on {}:{}".format(
+        arguments.host, arguments.port
+        ))
+
+    try:
+        while server.running:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    server.stop()
+    lib.Debugger.deb("frames sent: {}".format(server.frames))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,167 @@
+import math
+import multiprocessing as mp
+from Queue import Empty as QueueEmpty
+
+import numpy as np
+
+from errors import BackendError
+
+
+class PoolManager(object):
+    """
+    Multi-core CPU processing manager
+
+    splits channel pairs space into tiles and
+    calculates tiles of rank Gram matrix in worker processes;
+    ranks and results live in shared memory,
+    only tile coordinates are sent to workers
+
+    public methods:
+    - run_matrix - calculate matrix of squared rank differences sums
+    - close - stop worker processes
+    """
+    MATRIX_FORM = True
+    CAPABILITIES = {"numpy_matrix": True, "processes": True}
+    MIN_TILE = 16
+    WAIT_TIME = 1.
+
+    def __init__(self, workers=None):
+        self.workers_number = workers or mp.cpu_count()
+        self.workers = list()
+        self.capacity = (0, 0)
+
+    def run_matrix(self, sorted_list, window):
+        """
+        calculate matrix of squared rank differences sums
+        input:
+        - sorted_list - ranks per channel (channels x samples)
+        - window - processing block size
+        output:
+        - 2-D array (channels x channels)
+        """
+        ranks = np.asarray(sorted_list, dtype=np.float64)
+        channels, samples = ranks.shape
+        self._prepare(channels, samples)
+
+        shared = self._ranks_view(channels, samples)
+        np.subtract(ranks, ranks.mean(), out=shared)
+
+        tiles = self._tiles(channels)
+        for tile in tiles:
+            self.tasks.put((channels, samples) + tile)
+        self._wait(len(tiles))
+
+        gram = self._gram_view(channels).copy()
+        """ workers fill only upper tiles """
+        lower = np.tril_indices(channels, -1)
+        gram[lower] = gram.T[lower]
+        squares = gram.diagonal()
+
+        return squares[:, None] + squares[None, :] - 2*gram
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def close(self):
+        """ stop worker processes and free shared buffers """
+        for worker in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(self.WAIT_TIME)
+            if worker.is_alive():
+                worker.terminate()
+        self.workers = list()
+        self.capacity = (0, 0)
+        self.ranks = self.gram = None
+
+    def _wait(self, number):
+        """ wait for <number> done tiles while all workers are alive """
+        while number:
+            try:
+                self.done.get(timeout=self.WAIT_TIME)
+                number -= 1
+            except QueueEmpty:
+                if all(worker.is_alive() for worker in self.workers):
+                    continue
+                """ tasks of dead worker never come, pool is restarted """
+                for worker in self.workers:
+                    worker.terminate()
+                self.workers = list()
+                self.close()
+                raise BackendError("pool worker process died")
+
+    def _prepare(self, channels, samples):
+        """ (re)start workers if shared buffers are too small """
+        if channels <= self.capacity[0] and samples <= self.capacity[1]:
+            return
+
+        if self.workers:
+            self.close()
+
+        self.capacity = (channels, samples)
+        self.ranks = mp.RawArray('d', channels*samples)
+        self.gram = mp.RawArray('d', channels*channels)
+        self.tasks = mp.Queue()
+        self.done = mp.Queue()
+
+        for x in xrange(self.workers_number):
+            worker = TileWorker(self.tasks, self.done, self.ranks, self.gram)
+            worker.start()
+            self.workers.append(worker)
+
+    def _ranks_view(self, channels, samples):
+        return shared_view(self.ranks, (channels, samples))
+
+    def _gram_view(self, channels):
+        return shared_view(self.gram, (channels, channels))
+
+    def _tiles(self, channels):
+        """ split upper triangle of pairs space to tiles """
+        size = int(math.ceil(channels/float(self.workers_number)))
+        size = max(size, self.MIN_TILE)
+        bounds = [
+            (x, min(x+size, channels)) for x in xrange(0, channels, size)
+            ]
+
+        tiles = list()
+        for n, rows in enumerate(bounds):
+            for columns in bounds[n:]:
+                tiles.append(rows + columns)
+
+        return tiles
+
+
+class TileWorker(mp.Process):
+    """ Gram matrix tiles calculating process """
+
+    def __init__(self, tasks, done, ranks, gram):
+        mp.Process.__init__(self)
+        self.daemon = True
+        self.tasks = tasks
+        self.done = done
+        self.ranks = ranks
+        self.gram = gram
+
+    def run(self):
+        """ main tiles processing loop """
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+
+            channels, samples, row_a, row_b, col_a, col_b = task
+            ranks = shared_view(self.ranks, (channels, samples))
+            gram = shared_view(self.gram, (channels, channels))
+            gram[row_a:row_b, col_a:col_b] = np.dot(
+                ranks[row_a:row_b], ranks[col_a:col_b].T
+                )
+
+            self.done.put(task)
+
+
+def shared_view(raw_array, shape):
+    """ make array view of shared memory buffer head """
+    count = shape[0]*shape[1]
+    view = np.frombuffer(raw_array, dtype=np.float64, count=count)
+    return view.reshape(shape)
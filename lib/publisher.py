@@ -0,0 +1,250 @@
+import os
+import errno
+import select
+import socket
+import threading
+from collections import deque
+
+import lib
+from headless import BinaryWriter
+
+
+class Subscriber(object):
+    """ one subscriber connection with bounded queue of frames """
+
+    def __init__(self, connection, address, queue_size):
+        self.connection = connection
+        self.address = address
+        self.key = connection.fileno()
+        self.queue = deque()
+        self.queue_size = queue_size
+        self.current = None
+        self.dropped = 0
+        self.slow = False
+
+    def fileno(self):
+        return self.connection.fileno()
+
+    def pending(self):
+        return self.current is not None or bool(self.queue)
+
+    def send(self, lock):
+        """ send as much of queued frames as socket takes """
+        while True:
+            if self.current is None:
+                with lock:
+                    if not self.queue:
+                        return
+                    self.current = memoryview(self.queue.popleft())
+            sent = self.connection.send(self.current)
+            self.current = self.current[sent:] if sent < len(self.current) \
+                else None
+            if self.current is not None:
+                return
+
+
+class ResultPublisher(object):
+    """
+    Fan-out server of correlation results
+
+    every result is encoded once to headless binary frame
+    and queued to all subscribers; one thread sends queues
+    to sockets ready for writing, so slow subscribers never
+    block calculation: when queue of subscriber is full,
+    its oldest frame is dropped or subscriber is disconnected
+
+    public methods:
+    - start - listen for subscribers in background thread
+    - publish - queue result to all subscribers
+    - metrics - subscribers number and slow consumers counters
+    - stop - close all connections
+    """
+    POLICY_DROP_OLDEST = "drop_oldest"
+    POLICY_DISCONNECT = "disconnect"
+    POLICIES = (POLICY_DROP_OLDEST, POLICY_DISCONNECT)
+    QUEUE_SIZE = 64
+    SELECT_PIPES = os.name != "nt"
+    POLL_TIME = 0.01
+    BACKLOG = 16
+
+    def __init__(self, host="", port=0, queue_size=QUEUE_SIZE,
+                 policy=POLICY_DROP_OLDEST):
+        if policy not in self.POLICIES:
+            raise ValueError(
+                "unknown slow subscriber policy {}".format(policy)
+                )
+        self.policy = policy
+        self.queue_size = queue_size
+        self.subscribers = dict()
+        self.lock = threading.Lock()
+        self.running = False
+        self.thread = None
+        self.published = 0
+        self.dropped = 0
+        self.disconnected = 0
+
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind((host, port))
+        self.server.listen(self.BACKLOG)
+        self.server.setblocking(0)
+        self.address = self.server.getsockname()
+
+        """ publish wakes sending thread through pipe """
+        self.wake_read, self.wake_write = None, None
+        if self.SELECT_PIPES:
+            import fcntl
+            self.wake_read, self.wake_write = os.pipe()
+            fcntl.fcntl(self.wake_write, fcntl.F_SETFL, os.O_NONBLOCK)
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._loop)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def publish(self, number, full_dict, discr):
+        """ queue result to all subscribers, never waits for them """
+        frame = BinaryWriter.encode(number, full_dict, discr)
+        with self.lock:
+            self.published += 1
+            for subscriber in self.subscribers.values():
+                if len(subscriber.queue) >= subscriber.queue_size:
+                    if self.policy == self.POLICY_DISCONNECT:
+                        subscriber.queue.clear()
+                        subscriber.slow = True
+                        continue
+                    subscriber.queue.popleft()
+                    subscriber.dropped += 1
+                    self.dropped += 1
+                subscriber.queue.append(frame)
+        self._wake()
+
+    def metrics(self):
+        with self.lock:
+            return {
+                "subscribers": len(self.subscribers),
+                "published": self.published,
+                "dropped": self.dropped,
+                "disconnected": self.disconnected,
+            }
+
+    def stop(self):
+        """ stop sending thread and close all connections """
+        self.running = False
+        self._wake()
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+        with self.lock:
+            for subscriber in self.subscribers.values():
+                subscriber.connection.close()
+            self.subscribers.clear()
+        self.server.close()
+        if self.SELECT_PIPES:
+            os.close(self.wake_read)
+            os.close(self.wake_write)
+
+    def _wake(self):
+        if not self.SELECT_PIPES:
+            return
+        try:
+            os.write(self.wake_write, '.')
+        except OSError as error:
+            """ full pipe already wakes sending thread """
+            if error.errno != errno.EAGAIN:
+                raise
+
+    def _loop(self):
+        """ accept subscribers and send queued frames """
+        while self.running:
+            with self.lock:
+                subscribers = self.subscribers.values()
+            sources = [self.server] + subscribers
+            writers = [x for x in subscribers if x.pending() and not x.slow]
+            if self.SELECT_PIPES:
+                sources.append(self.wake_read)
+                readable, writable = select.select(sources, writers, [])[:2]
+            else:
+                readable, writable = select.select(
+                    sources, writers, [], self.POLL_TIME
+                    )[:2]
+
+            for source in readable:
+                if source is self.server:
+                    self._accept()
+                elif source == self.wake_read:
+                    os.read(self.wake_read, 4096)
+                else:
+                    self._read(source)
+
+            for subscriber in writable:
+                self._send(subscriber)
+
+            """ subscribers too slow for disconnect policy """
+            for subscriber in subscribers:
+                if subscriber.slow:
+                    self._close(subscriber)
+
+    def _accept(self):
+        try:
+            connection, address = self.server.accept()
+        except socket.error:
+            return
+        connection.setblocking(0)
+        connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        subscriber = Subscriber(connection, address, self.queue_size)
+        with self.lock:
+            self.subscribers[subscriber.key] = subscriber
+        lib.Debugger.deb("subscriber {}:{} connected".format(*address))
+
+    def _read(self, subscriber):
+        """ subscribers send nothing, readable socket is closed one """
+        try:
+            data = subscriber.connection.recv(4096)
+        except socket.error as error:
+            if error.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                return
+            data = None
+        if not data:
+            self._close(subscriber)
+
+    def _send(self, subscriber):
+        if subscriber.key not in self.subscribers:
+            return
+        try:
+            subscriber.send(self.lock)
+        except socket.error as error:
+            if error.errno not in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self._close(subscriber)
+
+    def _close(self, subscriber):
+        with self.lock:
+            if self.subscribers.pop(subscriber.key, None) is None:
+                return
+            if subscriber.slow:
+                self.disconnected += 1
+        subscriber.connection.close()
+        lib.Debugger.deb(
+            "subscriber {}:{} disconnected".format(*subscriber.address)
+            )
+
+
+def parse_address(string):
+    """ parse "[host:]port" string """
+    host, sep, port = string.rpartition(':')
+    return host, int(port)
+
+
+def start_publisher(arguments):
+    """ started publisher of _initiate_params_publish arguments or None """
+    if not arguments.publish:
+        return None
+    publisher = ResultPublisher(
+        *parse_address(arguments.publish),
+        queue_size=arguments.publish_queue,
+        policy=arguments.publish_policy
+        )
+    publisher.start()
+    return publisher
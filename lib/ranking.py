@@ -0,0 +1,86 @@
+import numpy as np
+
+
+class RankEngine(object):
+    """
+    Vectorized ranking engine
+
+    ranks every channel (column) of a window
+    (samples x channels) at once
+
+    public methods:
+    - rank - calculate average ranks for 2-D window
+    - rank_batch - calculate average ranks for 3-D stack of windows
+    - has_ties - check if any column of sorted window has equal values
+    """
+    DTYPE = np.float64
+
+    def rank(self, window):
+        """
+        calculate 1-based average ranks for every column
+        input:
+        - window - 2-D array-like (samples x channels)
+        output:
+        - 2-D float array of the same shape
+        """
+        values = np.asarray(window, dtype=self.DTYPE)
+        samples, channels = values.shape
+
+        order = values.argsort(axis=0, kind="mergesort")
+        columns = np.arange(channels)
+        sorted_values = values[order, columns]
+
+        ranks = np.empty_like(values)
+        if not self.has_ties(sorted_values):
+            """ fast path: ranks are plain positions in sorted order """
+            ranks[order, columns] = np.arange(
+                1, samples+1, dtype=self.DTYPE
+                )[:, None]
+            return ranks
+
+        ranks[order, columns] = self._average_ranks(sorted_values)
+        return ranks
+
+    def rank_batch(self, windows):
+        """
+        calculate 1-based average ranks for every column of every window
+        input:
+        - windows - 3-D array-like (windows x samples x channels)
+        output:
+        - 3-D float array of the same shape
+        """
+        values = np.asarray(windows, dtype=self.DTYPE)
+        number, samples, channels = values.shape
+        """ rank all windows' columns as one wide window """
+        wide = values.transpose(1, 0, 2).reshape(samples, number*channels)
+        ranks = self.rank(wide)
+
+        return ranks.reshape(samples, number, channels).transpose(1, 0, 2)
+
+    def has_ties(self, sorted_values):
+        """ check for equal neighbours in sorted columns """
+        return bool((sorted_values[1:] == sorted_values[:-1]).any())
+
+    def _average_ranks(self, sorted_values):
+        """
+        calculate average ranks of sorted columns
+        groups of equal values get mean of their positions
+        """
+        samples, channels = sorted_values.shape
+        """ walk columns one by one in a flat array """
+        flat = sorted_values.T.ravel()
+        new_group = np.ones(flat.shape, dtype=bool)
+        new_group[1:] = flat[1:] != flat[:-1]
+        """ every column starts a new group """
+        new_group[::samples] = True
+
+        group_id = new_group.cumsum() - 1
+        positions = np.tile(
+            np.arange(1, samples+1, dtype=self.DTYPE), channels
+            )
+        group_rank = (
+            np.bincount(group_id, weights=positions) /
+            np.bincount(group_id)
+            )
+
+        return group_rank[group_id].reshape(channels, samples).T
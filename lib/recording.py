@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+import os
+import sys
+import struct
+
+import numpy as np
+
+import lib
+
+"""
+Binary recording format:
+- header (little-endian):
+  magic "SCRC", version (uint16), dtype code (char), pad byte,
+  channels number (uint32), sample rate (float64),
+  names length (uint32), data offset (uint32)
+- channel names: utf-8, separated by zero bytes
+- samples: little-endian values, line by line,
+  starting from data offset (aligned to DATA_ALIGN)
+"""
+MAGIC = "SCRC"
+VERSION = 1
+HEADER = struct.Struct("<4sHcxIdII")
+DATA_ALIGN = 16
+DTYPES = {
+    'h': np.dtype("<i2"),
+    'f': np.dtype("<f4"),
+    'd': np.dtype("<f8"),
+}
+DTYPE_NAMES = {
+    "int16": 'h',
+    "float32": 'f',
+    "float64": 'd',
+}
+
+
+def is_recording(filename):
+    """ check if file starts with recording magic """
+    try:
+        with open(filename, 'rb') as input_file:
+            return input_file.read(len(MAGIC)) == MAGIC
+    except IOError:
+        return False
+
+
+class RecordingWriter(object):
+    """
+    Binary recording writer
+
+    values are stored exactly: integer recording
+    refuses fractional or out of range values
+
+    public methods:
+    - write - append lines (lines x values array)
+    - close - close output stream
+    """
+
+    def __init__(self, stream, channels, dtype='f', rate=0., names=()):
+        self.stream = stream
+        self.channels = channels
+        self.dtype = DTYPES[dtype]
+        self._write_header(dtype, rate, names)
+
+    def _write_header(self, dtype, rate, names):
+        names = '\0'.join(
+            name.encode("utf-8") if isinstance(name, unicode) else name
+            for name in names
+            )
+        size = HEADER.size + len(names)
+        offset = -(-size//DATA_ALIGN)*DATA_ALIGN
+
+        self.stream.write(HEADER.pack(
+            MAGIC, VERSION, dtype, self.channels, rate, len(names), offset
+            ))
+        self.stream.write(names)
+        self.stream.write('\0'*(offset-size))
+
+    def write(self, lines):
+        values = np.asarray(lines, dtype=self.dtype)
+        if self.dtype.kind == 'i' and not np.array_equal(values, lines):
+            raise ValueError(
+                "values do not fit {}, use float recording".format(
+                    self.dtype.name
+                    )
+                )
+        self.stream.write(values.reshape(-1, self.channels).tostring())
+
+    def close(self):
+        self.stream.close()
+
+
+class RecordingReader(object):
+    """
+    Binary recording reader
+
+    maps samples of recording file
+    to (lines x values) array without reading
+    """
+
+    def __init__(self, filename):
+        with open(filename, 'rb') as input_file:
+            header = input_file.read(HEADER.size)
+            if len(header) < HEADER.size:
+                raise ValueError("{} is not a recording".format(filename))
+
+            (magic, version, dtype, self.channels, self.rate,
+             names_len, offset) = HEADER.unpack(header)
+            if magic != MAGIC or version > VERSION:
+                raise ValueError("{} is not a recording".format(filename))
+            if dtype not in DTYPES or not self.channels:
+                raise ValueError(
+                    "{} has broken header: values type {!r}, "
+                    "{} channels".format(filename, dtype, self.channels)
+                    )
+
+            names = input_file.read(names_len)
+            self.names = names.decode("utf-8").split('\0') if names else []
+
+        self.dtype = DTYPES[dtype]
+        size = os.path.getsize(filename) - offset
+        lines = size//(self.dtype.itemsize*self.channels)
+        if lines:
+            self.data = np.memmap(
+                filename, dtype=self.dtype, mode='r',
+                offset=offset, shape=(lines, self.channels)
+                )
+        else:
+            self.data = np.empty((0, self.channels), dtype=self.dtype)
+
+    def __len__(self):
+        return len(self.data)
+
+
+def text_to_binary(source, target, dtype='f', rate=0., names=()):
+    """ convert text file to binary recording """
+    import datamanagers as dm
+
+    reader = dm.MappedFileReader()
+    if not reader.start(source, 1):
+        raise IOError(lib.errors[2].format(source))
+    if not reader.channels:
+        reader.stop()
+        raise ValueError("{} has no values".format(source))
+
+    try:
+        with open(target, 'wb') as output:
+            writer = RecordingWriter(
+                output, reader.channels, dtype, rate, names
+                )
+            while True:
+                lines, discr = reader.get_batch(reader.BLOCK_SIZE)
+                if lines is None:
+                    break
+                writer.write(lines)
+    except ValueError:
+        """ no half written recordings """
+        os.remove(target)
+        raise
+    finally:
+        reader.stop()
+
+
+def binary_to_text(source, target, block=2**16):
+    """ convert binary recording to text file """
+    recording = RecordingReader(source)
+    with open(target, 'w') as output:
+        for start in xrange(0, len(recording), block):
+            np.savetxt(
+                output, recording.data[start:start+block],
+                fmt="%.12g" if recording.dtype.kind == 'f' else "%d"
+                )
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = lib.ArgParser()
+    arg_parser._initiate_params_recording()
+    if not argv:
+        arg_parser.print_help()
+        sys.exit()
+
+    arguments = arg_parser.parse_args(argv)
+
+    try:
+        if is_recording(arguments.source):
+            binary_to_text(arguments.source, arguments.target)
+        else:
+            names = arguments.names.split(',') if arguments.names else ()
+            text_to_binary(
+                arguments.source, arguments.target,
+                DTYPE_NAMES[arguments.dtype], arguments.rate, names
+                )
+    except (IOError, ValueError) as error:
+        sys.exit(str(error))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,134 @@
+import numpy as np
+
+
+class CorrelationResult(object):
+    """
+    Correlation indexes of all channel pairs
+
+    stores upper triangle of correlation matrix
+    as a contiguous condensed float32 array
+    in (0, 1), (0, 2), ..., (1, 2), ... order
+    and behaves like a read-only dict keyed by (x, y)
+
+    public methods:
+    - from_matrix - make result from square matrix
+    - from_iter - make result from iterable of indexes
+    - index - condensed array position of (x, y) pair
+    - pair - (x, y) pair of condensed array position
+    - square - full symmetric matrix
+    - keys, values, items, get - dict-like access
+    """
+    DTYPE = np.float32
+    _pairs = dict()
+
+    def __init__(self, number, values=None):
+        self.number = number
+        size = number*(number-1)//2
+        if values is None:
+            self.values_array = np.zeros(size, dtype=self.DTYPE)
+        else:
+            self.values_array = np.ascontiguousarray(values, dtype=self.DTYPE)
+        self._square = None
+
+    @classmethod
+    def from_matrix(cls, matrix):
+        """ make result from upper triangle of square matrix """
+        matrix = np.asarray(matrix)
+        number = len(matrix)
+        rows, columns = cls.pairs_arrays(number)
+        return cls(number, matrix[rows, columns])
+
+    @classmethod
+    def from_iter(cls, iterable, number):
+        """ make result from iterable of indexes in pairs order """
+        size = number*(number-1)//2
+        values = np.fromiter(iterable, dtype=cls.DTYPE, count=size)
+        return cls(number, values)
+
+    @classmethod
+    def pairs_arrays(cls, number):
+        """ cached row and column indexes of upper triangle """
+        try:
+            return cls._pairs[number]
+        except KeyError:
+            pairs = np.triu_indices(number, 1)
+            cls._pairs[number] = pairs
+            return pairs
+
+    def index(self, x, y):
+        """ condensed array position of (x, y) pair """
+        if x > y:
+            x, y = y, x
+        if x == y or x < 0 or y >= self.number:
+            raise KeyError((x, y))
+        return x*(2*self.number-x-1)//2 + y-x-1
+
+    def pair(self, index):
+        """ (x, y) pair of condensed array position """
+        rows, columns = self.pairs_arrays(self.number)
+        return (int(rows[index]), int(columns[index]))
+
+    def square(self):
+        """
+        full symmetric matrix with ones on diagonal
+        built once and shared by all callers
+        """
+        if self._square is None:
+            square = np.ones((self.number, self.number), dtype=self.DTYPE)
+            rows, columns = self.pairs_arrays(self.number)
+            square[rows, columns] = self.values_array
+            square[columns, rows] = self.values_array
+            square.flags.writeable = False
+            self._square = square
+        return self._square
+
+    @property
+    def nbytes(self):
+        return self.values_array.nbytes
+
+    """ dict compatibility """
+    def __getitem__(self, key):
+        return float(self.values_array[self.index(*key)])
+
+    def __contains__(self, key):
+        try:
+            self.index(*key)
+        except (KeyError, TypeError):
+            return False
+        return True
+
+    def __len__(self):
+        return len(self.values_array)
+
+    def __iter__(self):
+        return self.iterkeys()
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def iterkeys(self):
+        rows, columns = self.pairs_arrays(self.number)
+        return iter(zip(rows.tolist(), columns.tolist()))
+
+    def itervalues(self):
+        return iter(self.values_array.tolist())
+
+    def iteritems(self):
+        return iter(self.items())
+
+    def keys(self):
+        return list(self.iterkeys())
+
+    def values(self):
+        return self.values_array.tolist()
+
+    def items(self):
+        return zip(self.keys(), self.values())
+
+    def __repr__(self):
+        return "{}({}, {})".format(
+            self.__class__.__name__, self.number, self.values_array
+            )
@@ -0,0 +1,155 @@
+import ctypes
+import multiprocessing as mp
+
+import numpy as np
+
+
+class RingBuffer(object):
+    """
+    Shared memory ring buffer of sample lines
+
+    one process writes blocks of lines, other one reads
+    them as array views without pickling and copying;
+    head and tail are counters of written and read lines,
+    each of them is changed by one side only;
+    writer waits while more than <limit> lines are queued
+
+    public methods:
+    - write - copy lines into buffer, wait for free space
+    - read - view of next lines, valid until next read
+    - skip - throw away oldest lines
+    - times - times of lines of last read, if buffer is timed
+    - available - number of lines ready to read
+    - close - mark end of data and wake both sides
+    """
+    WAIT = 0.1
+
+    def __init__(self, lines, channels, typecode='h', timed=False,
+                 limit=None):
+        self.lines = lines
+        self.limit = min(limit or lines, lines)
+        self.channels = channels
+        self.raw = mp.RawArray(typecode, lines*channels)
+        self.raw_times = mp.RawArray('d', lines) if timed else None
+        self.head = mp.RawValue(ctypes.c_longlong, 0)
+        self.tail = mp.RawValue(ctypes.c_longlong, 0)
+        self.closed = mp.RawValue('b', 0)
+        self.written = mp.Event()
+        self.freed = mp.Event()
+        self.reading = 0
+        self.view = None
+        self.times_view = None
+
+    def write(self, block, times=None):
+        """
+        copy (lines x channels) block and time of every line
+        into buffer, wait while buffer is full;
+        False if buffer is closed
+        """
+        size = len(block)
+        if size > self.limit:
+            raise ValueError("block is larger than ring buffer")
+
+        while self._free() < size:
+            if self.closed.value:
+                return False
+            self.freed.clear()
+            if self._free() < size:
+                self.freed.wait(self.WAIT)
+        if self.closed.value:
+            return False
+
+        start = self.head.value % self.lines
+        self._put(self._data(), start, block)
+        if self.raw_times is not None:
+            if times is None:
+                times = np.empty(size)
+                times.fill(np.nan)
+            self._put(self._times(), start, times)
+
+        self.head.value += size
+        self.written.set()
+        return True
+
+    def read(self, size):
+        """
+        view of next <size> lines, wait until they are written;
+        None if buffer is closed before;
+        lines of previous read are released
+        """
+        if size > self.lines:
+            raise ValueError("window is larger than ring buffer")
+
+        self._release()
+        while self.available() < size:
+            if self.closed.value and self.available() < size:
+                return None
+            self.written.clear()
+            if self.available() < size and not self.closed.value:
+                self.written.wait(self.WAIT)
+
+        lines = self._take(self._data(), self.tail.value % self.lines, size)
+        self.reading = size
+        return lines
+
+    def times(self):
+        """ times of lines of last read or None if buffer is not timed """
+        if self.raw_times is None or not self.reading:
+            return None
+        return self._take(
+            self._times(), self.tail.value % self.lines, self.reading
+            )
+
+    def skip(self, size):
+        """ throw away up to <size> oldest lines, return their number """
+        self._release()
+        size = min(size, self.available())
+        self.tail.value += size
+        self.freed.set()
+        return size
+
+    def available(self):
+        """ number of written lines not read yet """
+        return self.head.value - self.tail.value - self.reading
+
+    def close(self):
+        """ mark end of data """
+        self.closed.value = 1
+        self.written.set()
+        self.freed.set()
+
+    def _free(self):
+        """ lines writer can add now """
+        return self.limit - (self.head.value - self.tail.value)
+
+    def _release(self):
+        """ let writer reuse lines of previous read """
+        if self.reading:
+            self.tail.value += self.reading
+            self.reading = 0
+            self.freed.set()
+
+    def _put(self, data, start, values):
+        size = len(values)
+        first = min(size, self.lines - start)
+        data[start:start+first] = values[:first]
+        data[:size-first] = values[first:]
+
+    def _take(self, data, start, size):
+        if start + size <= self.lines:
+            return data[start:start+size]
+        """ window wraps around buffer end """
+        return np.concatenate((data[start:], data[:start+size-self.lines]))
+
+    def _times(self):
+        if self.times_view is None:
+            self.times_view = np.frombuffer(self.raw_times, dtype=np.float64)
+        return self.times_view
+
+    def _data(self):
+        """ array view of shared memory, made in every process """
+        if self.view is None:
+            self.view = np.frombuffer(
+                self.raw, dtype=np.dtype(self.raw._type_)
+                ).reshape(self.lines, self.channels)
+        return self.view
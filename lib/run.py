@@ -1,9 +1,4 @@
-from gui import Presenter
-
-
-def main():
-    presenter = Presenter()
-    presenter.run()
+from gui import main
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,242 @@
+#!/usr/bin/env python
+import os
+import sys
+import json
+import time
+import threading
+import multiprocessing as mp
+from Queue import Queue
+from Queue import Empty as QueueEmpty
+from collections import OrderedDict, deque
+
+import lib
+from spearman import Model
+
+
+class SessionManager(object):
+    """
+    Several calculation sessions in one process
+
+    every session has its own data reader and window settings,
+    all of them share one bounded pool of worker threads
+    and processing backends; sessions are given one
+    calculation step each in turn, so slow or fast data
+    sources can't take the whole pool
+
+    public methods:
+    - add - start new session reading file or NMCServer
+    - remove - stop session
+    - run - yield results tagged by session name
+    - close - stop all sessions and workers
+    """
+    WORKERS = mp.cpu_count()
+    IDLE_TIME = 0.005
+    CLOSE_TIMEOUT = 2.
+
+    def __init__(self, workers=WORKERS, backend=Model.BACKEND_AUTO):
+        self.backend = backend
+        self.sessions = OrderedDict()
+        self.order = deque()
+        self.busy = set()
+        self.removed = set()
+        self.locks = dict()
+        self.tasks = Queue()
+        self.done = Queue()
+
+        self.workers = list()
+        for x in xrange(workers):
+            worker = threading.Thread(target=self._work)
+            worker.daemon = True
+            worker.start()
+            self.workers.append(worker)
+
+    def add(self, name, mode, **kwargs):
+        """ start session <name>, kwargs are Model.start_spearman ones """
+        if name in self.sessions:
+            raise ValueError("session {} already exists".format(name))
+
+        model = Model(self.backend)
+        if not model.start_spearman(mode, **kwargs):
+            return False
+
+        manager = model.cuda_manager
+        if not manager.CAPABILITIES.get("thread_safe"):
+            """ backend instance is shared, calls are serialized """
+            self.locks.setdefault(id(manager), threading.Lock())
+
+        self.sessions[name] = model
+        self.order.append(name)
+        return True
+
+    def remove(self, name):
+        """ stop session, at once or after its current step """
+        if name in self.busy:
+            self.removed.add(name)
+            return
+
+        model = self.sessions.pop(name)
+        self.order.remove(name)
+        self.removed.discard(name)
+        model.stop_spearman()
+
+    def run(self):
+        """
+        calculate until all sessions end,
+        yield (name, full_dict, discr) in order of calculation
+        """
+        while self.sessions:
+            self._schedule()
+            try:
+                name, result = self.done.get(timeout=self.IDLE_TIME)
+            except QueueEmpty:
+                continue
+
+            self.busy.discard(name)
+            if name in self.removed:
+                self.remove(name)
+                continue
+
+            if isinstance(result, Exception):
+                lib.Debugger.deb("session {}: {}".format(name, result))
+                self.remove(name)
+                continue
+
+            full_dict, discr = result
+            if not full_dict:
+                self.remove(name)
+                continue
+            yield name, full_dict, discr
+
+    def close(self):
+        """
+        stop all sessions and workers; data sources are stopped first,
+        so steps waiting for data end, workers stuck longer
+        than CLOSE_TIMEOUT are left behind
+        """
+        for name, model in self.sessions.items():
+            self.removed.add(name)
+            model.interrupt_spearman()
+
+        deadline = time.time() + self.CLOSE_TIMEOUT
+        while self.busy:
+            try:
+                name, result = self.done.get(
+                    timeout=max(deadline - time.time(), 0)
+                    )
+            except QueueEmpty:
+                break
+            self.busy.discard(name)
+        self.busy.clear()
+        for name in list(self.sessions):
+            self.remove(name)
+
+        for worker in self.workers:
+            self.tasks.put(None)
+        for worker in self.workers:
+            worker.join(max(deadline - time.time(), 0))
+        self.workers = list()
+
+    def _schedule(self):
+        """ give one step to every idle session with ready data """
+        for x in xrange(len(self.order)):
+            if len(self.busy) >= len(self.workers):
+                break
+
+            name = self.order[0]
+            self.order.rotate(-1)
+            if name in self.busy or not self.sessions[name].ready():
+                continue
+
+            self.busy.add(name)
+            self.tasks.put((name, self.sessions[name]))
+
+    def _work(self):
+        """ worker thread loop: calculate one step of given session """
+        while True:
+            task = self.tasks.get()
+            if task is None:
+                break
+
+            name, model = task
+            try:
+                lock = self.locks.get(id(model.cuda_manager))
+                if lock is None:
+                    result = model.calculate_loop()
+                else:
+                    with lock:
+                        result = model.calculate_loop()
+            except Exception as error:
+                result = error
+            self.done.put((name, result))
+
+
+def parse_session(string):
+    """
+    parse "source[,window[,stride]]" string,
+    source is file path or NMCServer host:port
+    """
+    items = string.split(',')
+    kwargs = {
+        "entry_frame": int(items[1]) if len(items) > 1 else Model.WINDOW,
+        "entry_stride": int(items[2]) if len(items) > 2 else 0,
+    }
+
+    source = items[0]
+    host, sep, port = source.rpartition(':')
+    if not os.path.exists(source) and sep and port.isdigit():
+        kwargs["entry_host"] = host
+        kwargs["entry_port"] = int(port)
+        return Model.MODE_NET, kwargs
+
+    kwargs["entry_file"] = source
+    return Model.MODE_FILE, kwargs
+
+
+def main(argv=sys.argv[1:]):
+    arg_parser = lib.ArgParser()
+    arg_parser._initiate_params_sessions()
+    if not argv:
+        arg_parser.print_help()
+        sys.exit()
+
+    arguments = arg_parser.parse_args(argv)
+
+    if arguments.output == '-':
+        stream = sys.stdout
+    else:
+        try:
+            stream = open(arguments.output, 'w')
+        except IOError:
+            sys.exit(lib.errors[2].format(arguments.output))
+
+    manager = SessionManager(
+        arguments.workers or SessionManager.WORKERS, arguments.backend
+        )
+    for source in arguments.sessions:
+        mode, kwargs = parse_session(source)
+        if not manager.add(source, mode, **kwargs):
+            sys.stderr.write(lib.errors[2].format(source))
+
+    windows = dict()
+    try:
+        for name, full_dict, discr in manager.run():
+            stream.write(json.dumps({
+                "session": name,
+                "window": windows.get(name, 0),
+                "keys": full_dict["keys"],
+                "discr": discr,
+                "kfs": full_dict["kfs"].values(),
+                }) + '\n')
+            windows[name] = windows.get(name, 0) + 1
+    except KeyboardInterrupt:
+        pass
+    finally:
+        manager.close()
+
+    stream.flush()
+    if stream is not sys.stdout:
+        stream.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,152 @@
+import math
+
+import numpy as np
+
+from ranking import RankEngine
+
+
+class SlidingSpearman(object):
+    """
+    Sliding window Spearman processing
+
+    keeps last <window> samples of every channel in a ring;
+    with small <stride> ranks are updated when a sample enters
+    and the oldest one leaves: four vectorized comparisons
+    with the window, O(window x channels) pro sample;
+    with large <stride> the window is ranked anew pro result,
+    O(window x channels x log(window)) pro stride;
+    updates are used while stride < RERANK_FACTOR x log2(window),
+    see "SlidingSpearman" stages of benchmark
+
+    ranks are kept doubled, so ties' halves stay integer
+
+    public methods:
+    - push - add one sample line
+    - update - add several sample lines
+    - missing - number of lines to push until next result
+    - reset - forget all collected samples
+    """
+    DTYPE = np.float64
+    RANK_DTYPE = np.int32
+    """ one re-rank costs about so many updates pro log2(window) """
+    RERANK_FACTOR = 1.
+
+    def __init__(self, window, stride=1, incremental=None):
+        self.window = int(window)
+        self.stride = max(int(stride), 1)
+        if incremental is None:
+            incremental = self.stride < self.RERANK_FACTOR*math.log(
+                max(self.window, 2), 2
+                )
+        self.incremental = incremental
+        self.engine = RankEngine()
+        self.reset()
+
+    def reset(self):
+        """ forget all collected samples """
+        self.values = None
+        self.ranks = None
+        self.sums = None
+        self.head = 0
+        self.filled = 0
+        self.steps = 0
+
+    def update(self, lines):
+        """
+        add sample lines (samples x channels)
+        and return the last calculated matrix
+        of squared rank differences sums or None
+        """
+        result = None
+        for line in np.asarray(lines, dtype=self.DTYPE):
+            sums = self.push(line)
+            if sums is not None:
+                result = sums
+
+        return result
+
+    def missing(self):
+        """ number of sample lines to push until next result """
+        if self.values is None:
+            return self.window
+        return max(self.stride - self.steps, 1)
+
+    def push(self, line):
+        """
+        add one sample line, return matrix
+        of squared rank differences sums
+        each <stride> samples once window is full
+        """
+        line = np.asarray(line, dtype=self.DTYPE)
+        if self.values is None:
+            self._allocate(len(line))
+
+        if self.filled < self.window:
+            if self.incremental:
+                self._insert(self.filled, line)
+            self.values[self.filled] = line
+            self.filled += 1
+        else:
+            if self.incremental:
+                self._replace(self.head, line)
+            self.values[self.head] = line
+            self.head = (self.head+1) % self.window
+
+        self.steps += 1
+        if self.filled == self.window and self.steps >= self.stride:
+            self.steps = 0
+            self.sums = self._squared_sums()
+            return self.sums
+
+    def _allocate(self, channels):
+        """ prepare ring buffers for <channels> channels """
+        self.values = np.zeros((self.window, channels), dtype=self.DTYPE)
+        if self.incremental:
+            shape = (self.window, channels)
+            self.ranks = np.zeros(shape, dtype=self.RANK_DTYPE)
+            self.flags = np.empty(shape, dtype=bool)
+            self.delta = np.empty(shape, dtype=self.RANK_DTYPE)
+        """ first emission comes right after window is full """
+        self.steps = self.stride - self.window
+
+    def _insert(self, slot, line):
+        """ rank sample while window is not full yet """
+        shifted = self._shift(slot, line)
+        self.ranks[:slot] += shifted
+        self.ranks[slot] = 2*slot + 2 - shifted.sum(axis=0)
+
+    def _replace(self, slot, line):
+        """ replace the oldest sample with a new one """
+        leaving = self.values[slot].copy()
+        shifted = self._shift(self.window, line)
+        self.ranks += shifted
+        """ sums include leaving sample, which is excluded """
+        rank = 2*self.window - shifted.sum(axis=0) + shifted[slot]
+        self.ranks -= self._shift(self.window, leaving)
+        self.ranks[slot] = rank
+
+    def _shift(self, used, value):
+        """
+        doubled rank change of first <used> samples
+        when <value> enters: 2 above it, 1 if equal
+        """
+        values = self.values[:used]
+        flags = self.flags[:used]
+        delta = self.delta[:used]
+        np.greater(values, value, out=flags)
+        np.copyto(delta, flags)
+        np.greater_equal(values, value, out=flags)
+        np.add(delta, flags, out=delta, casting="unsafe")
+        return delta
+
+    def _squared_sums(self):
+        """ calculate squared rank differences sums of all pairs """
+        if self.incremental:
+            centered = self.ranks - (self.window+1.)
+            centered *= 0.5
+        else:
+            centered = self.engine.rank(self.values) - (self.window+1)/2.
+        gram = np.dot(centered.T, centered)
+        squares = gram.diagonal()
+
+        return squares[:, None] + squares[None, :] - 2*gram
@@ -1,26 +1,34 @@
 #!/usr/bin/env python
+import os
 import sys
+import imp
+import json
 import math
+from collections import OrderedDict, deque
+from timeit import default_timer
+import numpy as np
 
 __version__ = "0.5"
 __author__ = "Ilya Kaznacheev"
 
 """
 Check if Python library for CUDA
-is installed, if not - enable emulation mode
+is installed, if not - enable emulation mode;
+CUDA context is created only when CUDA backend is used first time
 """
 try:
-    import pycuda.autoinit
+    imp.find_module("pycuda")
 except ImportError:
     EMULATE_MOD = True
 else:
-    import pycuda.driver as drv
-    from pycuda.compiler import SourceModule
-    import numpy as np
     EMULATE_MOD = False
 
 import lib
 import datamanagers as dm
+from ranking import RankEngine
+from sliding import SlidingSpearman
+from results import CorrelationResult
+from pool import PoolManager
 
 
 class Model(object):
@@ -29,77 +37,231 @@ class Model(object):
     LOCALHOST = "127.0.0.1"
     MODE_NET = "net"
     MODE_FILE = "file"
-
-    def __init__(self):
+    BACKEND_AUTO = "auto"
+    BACKEND_TUNE = "tune"
+    BACKEND_CUDA = "cuda"
+    BACKEND_EMULATOR = "emulator"
+    BACKEND_MATRIX = "matrix"
+    BACKEND_POOL = "pool"
+    CHANNELS = 29
+    BATCH = 1
+
+    def __init__(self, backend=BACKEND_AUTO):
         self.core = Spearman()
-
-        global EMULATE_MOD
-        if EMULATE_MOD:
-            self.cuda_manager = CUDAEmulator()
-        else:
-            self.cuda_manager = CUDAManager()
+        self.sliding = None
+        self.batch = self.BATCH
+        self.results = deque()
+        self.backend = backend or self.BACKEND_AUTO
+        self.backend_name = None
+        self.cuda_manager = None
 
     def start_spearman(self, mode, **kwargs):
-        self.core.set_global(int(kwargs["entry_frame"]))
+        window = int(kwargs["entry_frame"])
+        stride = int(kwargs.pop("entry_stride", 0) or 0)
+        channels = int(kwargs.pop("entry_channels", 0) or self.CHANNELS)
+        self.batch = int(kwargs.pop("entry_batch", 0) or self.BATCH)
+        policy = kwargs.pop("entry_policy", None)
+        self.results.clear()
+        self.core.set_global(window)
+
+        """ read only <stride> new lines pro iteration in sliding mode """
+        self.sliding = None
+        if 0 < stride < window:
+            self.sliding = SlidingSpearman(window, stride)
+            kwargs["entry_frame"] = stride
 
         if mode == self.MODE_NET:
             self.reader = dm.AsyncReader()
+            if policy:
+                kwargs["entry_policy"] = policy
         elif mode == self.MODE_FILE:
-            self.reader = dm.FileReader()
+            if dm.BinaryReader.accepts(kwargs["entry_file"]):
+                self.reader = dm.BinaryReader()
+            else:
+                self.reader = dm.MappedFileReader()
 
         status = self.reader.start(**kwargs)
 
+        if status:
+            """ reader knows real number of values in line """
+            self._acquire_backend(self.reader.channels or channels, window)
+
         return status
 
     def calculate_loop(self):
+        if self.sliding:
+            return self._sliding_loop()
+        backlog = self.reader.catch_up()
+        if self.results or self.batch > 1 or backlog > 1:
+            return self._batch_loop(max(self.batch, backlog))
+
         raw_data, discr = self.reader.get()
-        if raw_data:
+        if raw_data is not None and len(raw_data):
             sorted_list = self.core.make_full_list(raw_data)
             full_dict = self._cuda_processing(sorted_list)
+            full_dict["time"] = self._window_time(self.reader.window_times())
             return full_dict, discr
         else:
             return None, discr
 
-    def stop_spearman(self):
+    def calculate_batch(self, limit):
+        """
+        calculate up to <limit> windows already queued
+        in reader with one vectorized call,
+        yield results in windows order
+        """
+        raw_batch, discr = self.reader.get_batch(limit)
+        if raw_batch is not None and len(raw_batch):
+            times = self.reader.window_times()
+            sorted_batch = self.core.make_batch_list(raw_batch)
+            for number, full_dict in enumerate(self.core.process_batch(
+                    self.cuda_manager, sorted_batch
+                    )):
+                full_dict["time"] = self._window_time(times, number)
+                yield full_dict, discr
+
+    def interrupt_spearman(self):
+        """
+        wake calculation waiting for data by stopping data source,
+        backend is kept until stop_spearman
+        """
         self.reader.stop()
 
-    def _cuda_processing(self, sorted_list):
-        precomp_tuple = self.core.precomparing(sorted_list)
-        comp_list = self.cuda_manager.run_gpu(
-            *precomp_tuple[:3], window=self.core.window
-            )
-        index_list = self.core.postcomparing(comp_list, precomp_tuple[3])
+    def stop_spearman(self):
+        self.reader.stop()
+        self._release_backend()
 
-        full_dict = {
-            "keys": precomp_tuple[3],
-            "kfs": index_list
-        }
+    def _acquire_backend(self, channels, window):
+        """
+        take backend from registry; auto mode takes the one
+        tuned before for these sizes, tune mode measures them all
+        """
+        self._release_backend()
+        name = self.backend
+        if name == self.BACKEND_AUTO:
+            name = REGISTRY.choose(channels, window)
+        elif name == self.BACKEND_TUNE:
+            name = REGISTRY.autotune(channels, window)
+        self.cuda_manager = REGISTRY.create(name)
+        self.backend_name = name
+
+    def _release_backend(self):
+        """ give backend back, last user closes it """
+        if self.backend_name is not None:
+            REGISTRY.release(self.backend_name)
+        self.backend_name = None
+        self.cuda_manager = None
+
+    def metrics(self):
+        """ overflow metrics of data reader or None """
+        return self.reader.metrics()
+
+    def ready(self):
+        """ next calculate_loop call won't wait for data """
+        if self.results:
+            return True
+        if self.sliding:
+            """ sliding step reads strides until its result """
+            return self.reader.ready(
+                -(-self.sliding.missing()//self.sliding.stride)
+                )
+        return self.reader.ready()
+
+    def _batch_loop(self, limit):
+        """ return next result of current batch, calculate new if empty """
+        if not self.results:
+            self.results.extend(self.calculate_batch(limit))
+        if not self.results:
+            return None, None
+        return self.results.popleft()
+
+    def _sliding_loop(self):
+        """ read lines until sliding window is ready """
+        while True:
+            raw_data, discr = self.reader.get()
+            if raw_data is None or not len(raw_data):
+                return None, discr
+
+            korr_matrix = self.sliding.update(raw_data)
+            if korr_matrix is not None:
+                index_list = self.core.matrix_comparing(korr_matrix)
+                full_dict = {
+                    "keys": len(korr_matrix),
+                    "kfs": index_list,
+                    "time": self._window_time(self.reader.window_times()),
+                }
+                return full_dict, discr
+
+    def _window_time(self, times, number=0):
+        """ time of window end if reader knows it, otherwise None """
+        if times is None or number >= len(times):
+            return None
+        value = float(times[number])
+        return None if math.isnan(value) else value
 
-        return full_dict
+    def _cuda_processing(self, sorted_list):
+        return self.core.process(self.cuda_manager, sorted_list)
 
 
 class CUDAManager(object):
     """ CUDA processing manager """
     CUDA_SOURSE = "sas.cu"
+    MATRIX_FORM = False
+    CAPABILITIES = {"gpu": True}
     MAX_THREADS = 512
 
     def __init__(self, file_name=CUDA_SOURSE):
-        sourse = open(file_name).read()
-        module = SourceModule(sourse)
-        # *************************************************
-        # self.context = None
-        # self.device = pycuda.autoinit.device
-        # self.computecc = self.device.compute_capability()
-        # self.module = drv.module_from_file("sas.cubin")
-        # self.module = drv.module_from_buffer("sas.ptx")
-        # *************************************************
-        self.cuda_exec_func = module.get_function("subtract_and_square")
+        self.file_name = file_name
+        self.cuda_exec_func = None
+
+    def _init_cuda(self):
+        """ create CUDA context and load kernel on first use """
+        import pycuda.autoinit
+        import pycuda.driver as drv
 
-        device = pycuda.tools.get_default_device()
+        self.driver = drv
+        device = pycuda.autoinit.device
         self.capability = device.compute_capability()
 
+        module = self._load_module()
+        self.cuda_exec_func = module.get_function("subtract_and_square")
+
+    def _load_module(self):
+        """
+        load kernel binary compiled for current device,
+        compile source and save binary next to it if there is no one
+        """
+        from pycuda.compiler import compile as cuda_compile
+
+        binary = "{}.sm_{}{}.cubin".format(
+            os.path.splitext(self.file_name)[0], *self.capability
+            )
+        if (os.path.exists(binary) and
+                os.path.getmtime(binary) >= os.path.getmtime(self.file_name)):
+            return self.driver.module_from_file(binary)
+
+        cubin = cuda_compile(open(self.file_name).read())
+        try:
+            with open(binary, 'wb') as binary_file:
+                binary_file.write(cubin)
+        except IOError:
+            pass
+
+        return self.driver.module_from_buffer(cubin)
+
+    @classmethod
+    def available(cls):
+        return not EMULATE_MOD
+
+    def close(self):
+        pass
+
     def run_gpu(self, list_one, list_two, dimension, window):
         """ run CUDA GPU computing """
+        if not self.cuda_exec_func:
+            self._init_cuda()
+        drv = self.driver
+
         sys.stdout.flush()
         list_one_float = np.array(list_one).astype(np.float32)
         list_two_float = np.array(list_two).astype(np.float32)
@@ -128,6 +290,8 @@ class CUDAEmulator(object):
     """ emulate gpu logic
         if cuda toolkit is not instaled.
         may takes very long time """
+    MATRIX_FORM = False
+    CAPABILITIES = {"pure_python": True, "thread_safe": True}
 
     def __init__(self):
         lib.Debugger.deb(
@@ -138,6 +302,13 @@ class CUDAEmulator(object):
             """         and install CUDA Toolkit on your computer\n"""
             )
 
+    @classmethod
+    def available(cls):
+        return True
+
+    def close(self):
+        pass
+
     def run_gpu(self, list_one, list_two, dimension, window):
         dest = list()
 
@@ -147,10 +318,68 @@ class CUDAEmulator(object):
         return dest
 
 
+class MatrixManager(object):
+    """
+    CPU all-pairs processing manager
+
+    calculates squared rank differences of all channel pairs
+    with one matrix product of centered rank matrix:
+    sum((a-b)**2) = sum(a**2) + sum(b**2) - 2*sum(a*b)
+    """
+    MATRIX_FORM = True
+    CAPABILITIES = {
+        "numpy_matrix": True, "batch": True, "thread_safe": True
+        }
+
+    @classmethod
+    def available(cls):
+        return True
+
+    def close(self):
+        pass
+
+    def run_matrix(self, sorted_list, window):
+        """
+        calculate matrix of squared rank differences sums
+        input:
+        - sorted_list - ranks per channel (channels x samples)
+        - window - processing block size
+        output:
+        - 2-D array (channels x channels)
+        """
+        ranks = np.asarray(sorted_list, dtype=np.float64)
+        """ ranks of every channel have the same mean value """
+        centered = ranks - ranks.mean()
+        gram = np.dot(centered, centered.T)
+        squares = gram.diagonal()
+
+        return squares[:, None] + squares[None, :] - 2*gram
+
+    def run_batch(self, sorted_batch, window):
+        """
+        calculate matrices of squared rank differences sums
+        for stack of windows with one batched matrix product
+        input:
+        - sorted_batch - ranks (windows x channels x samples)
+        - window - processing block size
+        output:
+        - 3-D array (windows x channels x channels)
+        """
+        ranks = np.asarray(sorted_batch, dtype=np.float64)
+        centered = ranks - ranks.mean()
+        gram = np.matmul(centered, centered.transpose(0, 2, 1))
+        squares = np.diagonal(gram, axis1=1, axis2=2)
+
+        return squares[:, :, None] + squares[:, None, :] - 2*gram
+
+
 class Spearman(object):
     """ Computing Spearman korellation index
         based on cuda parallel computing """
 
+    def __init__(self):
+        self.ranking = RankEngine()
+
     def set_global(self, window):
         """ set global variables """
         """ set processing block size """
@@ -159,38 +388,72 @@ class Spearman(object):
         self.denominator = float(self.window*(self.window**2-1))
 
     def make_full_list(self, raw_list):
-        """ transponate input arrays """
-        val_list = list()
-        map(lambda x: val_list.append([]), xrange(len(raw_list[0])))
+        """
+        rank input window (samples x channels)
+        and return ranks per channel (channels x samples)
+        """
+        return self.ranking.rank(raw_list).T
+
+    def make_batch_list(self, raw_batch):
+        """
+        rank stack of input windows (windows x samples x channels)
+        and return ranks per channel (windows x channels x samples)
+        """
+        return self.ranking.rank_batch(raw_batch).transpose(0, 2, 1)
 
-        for line in raw_list:
-            for n, val in enumerate(line):
-                val_list[n].append(float(val))
+    def long_sorting(self, val_list):
+        """
+        calculate average ranks
+        of channel lists (channels x samples)
+        """
+        return self.ranking.rank(zip(*val_list)).T
 
-        return self.long_sorting(val_list)
+    def process(self, manager, sorted_list):
+        """
+        calculate korellation indexes of ranked window
+        with <manager> processing backend
+        """
+        if manager.MATRIX_FORM:
+            korr_matrix = manager.run_matrix(sorted_list, window=self.window)
+            length = len(korr_matrix)
+            index_list = self.matrix_comparing(korr_matrix)
+        else:
+            precomp_tuple = self.precomparing(sorted_list)
+            comp_list = manager.run_gpu(
+                *precomp_tuple[:3], window=self.window
+                )
+            length = precomp_tuple[3]
+            index_list = self.postcomparing(comp_list, length)
 
-    # def run_sorting(self, val_list):
-    #     """ calculate sorting indexes """
-    #     sorted_list = list()
-    #     for item in val_list:
-    #         sorted_list.append(
-    #             [i[0] for i in sorted(enumerate(item), key=lambda x:x[1])]
-    #             )
+        full_dict = {
+            "keys": length,
+            "kfs": index_list
+        }
 
-    #     return sorted_list
+        return full_dict
 
-    def long_sorting(self, val_list):
+    def process_batch(self, manager, sorted_batch):
         """
-        calculate sorting indexes
-        without duplicates
+        calculate korellation indexes of stack of ranked windows,
+        backends without batch support process windows one by one
         """
-        sorted_list = list()
-        for item in val_list:
-            ranks = {y: x for x, y in enumerate(sorted(set(item)))}
-            sorted_item = [ranks[x] for x in item]
-            sorted_list.append(sorted_item)
+        if not manager.CAPABILITIES.get("batch"):
+            return [
+                self.process(manager, sorted_list)
+                for sorted_list in sorted_batch
+                ]
+
+        korr_batch = manager.run_batch(sorted_batch, window=self.window)
+        length = korr_batch.shape[1]
+        rows, columns = CorrelationResult.pairs_arrays(length)
+        calc_batch = np.abs(
+            1 - (6*korr_batch[:, rows, columns])/self.denominator
+            )
 
-        return sorted_list
+        return [
+            {"keys": length, "kfs": CorrelationResult(length, calc_list)}
+            for calc_list in calc_batch
+            ]
 
     def precomparing(self, sorted_list):
         """ compare all list pairs """
@@ -230,6 +493,16 @@ class Spearman(object):
 
         return named_dict
 
+    def matrix_comparing(self, korr_matrix):
+        """ calculate korellation indexes from pairs matrix """
+        length = len(korr_matrix)
+        rows, columns = CorrelationResult.pairs_arrays(length)
+        calc_list = np.abs(
+            1 - (6*korr_matrix[rows, columns])/self.denominator
+            )
+
+        return CorrelationResult(length, calc_list)
+
     def chunks(self, l, n):
         """ slice list to N parts """
         for i in xrange(0, len(l), n):
@@ -237,29 +510,171 @@ class Spearman(object):
 
     def preset_numbers(self, array, number):
         """ make keys """
-        number_list = range(number)
-        result = dict()
-        for x in number_list:
-            for y in number_list[x+1:]:
-                result[(x, y)] = array.next()
-
-        return result
+        return CorrelationResult.from_iter(array, number)
 
     def calculate_spearman_index(self, korr_list):
         coefficient = abs(1 - (6*sum(korr_list))/self.denominator)
         return coefficient
 
 
+class BackendRegistry(object):
+    """
+    Registry of processing backends
+
+    public methods:
+    - register - add backend class under some name
+    - available - names of backends usable on this device
+    - capabilities - capabilities advertised by backend
+    - create - get (shared) backend instance by name
+    - release - give instance back, close it when nobody uses it
+    - choose - backend tuned before for given sizes, without measuring
+    - autotune - choose the fastest backend for given sizes
+
+    autotune results are kept in TUNED_FILE between runs
+    """
+    AUTOTUNE_REPEAT = 3
+    PYTHON_LIMIT = 10**5
+    TUNED_FILE = os.path.join(os.path.expanduser("~"), ".spearman_tuned.json")
+
+    def __init__(self, tuned_file=TUNED_FILE):
+        self.backends = OrderedDict()
+        self.instances = dict()
+        self.users = dict()
+        self.tuned_file = tuned_file
+        self.tuned = None
+
+    def register(self, name, manager_class):
+        self.backends[name] = manager_class
+
+    def available(self):
+        return [
+            name for name, manager_class in self.backends.items()
+            if manager_class.available()
+            ]
+
+    def capabilities(self, name):
+        return self.backends[name].CAPABILITIES
+
+    def create(self, name):
+        """
+        get backend instance, create it on first request;
+        every create should be paired with release
+        """
+        if name not in self.instances:
+            self.instances[name] = self.backends[name]()
+        self.users[name] = self.users.get(name, 0) + 1
+        return self.instances[name]
+
+    def release(self, name):
+        """ close instance when its last user releases it """
+        self.users[name] = self.users.get(name, 0) - 1
+        if self.users[name] > 0:
+            return
+        self.users.pop(name)
+        manager = self.instances.pop(name, None)
+        if manager:
+            manager.close()
+
+    def choose(self, channels, window):
+        """
+        backend name autotuned for the sizes in this or earlier run,
+        matrix backend if they were never tuned; nothing is created
+        """
+        name = self._load().get(self._key(channels, window))
+        if name in self.backends and self.backends[name].available():
+            return name
+        return Model.BACKEND_MATRIX
+
+    def autotune(self, channels, window):
+        """
+        run micro-benchmark of all available backends
+        on synthetic window and return the fastest backend name;
+        backends failing to start or process are skipped
+        """
+        core = Spearman()
+        core.set_global(window)
+        data = np.random.RandomState(0).rand(window, channels)
+        sorted_list = core.make_full_list(data)
+        """ pure python backends are hopeless on big windows """
+        elements = channels*(channels-1)//2*window
+
+        timings = dict()
+        for name in self.available():
+            if (self.capabilities(name).get("pure_python") and
+                    elements > self.PYTHON_LIMIT):
+                continue
+
+            try:
+                timings[name] = self._measure(name, core, sorted_list)
+            except Exception as error:
+                lib.Debugger.deb(
+                    "backend {} excluded from autotune: {}".format(
+                        name, error
+                        )
+                    )
+
+        best = Model.BACKEND_MATRIX
+        if timings:
+            best = min(timings, key=timings.get)
+
+        self._load()[self._key(channels, window)] = best
+        self._save()
+        lib.Debugger.deb(
+            "backend {} chosen for {} channels, window {}".format(
+                best, channels, window
+                )
+            )
+        return best
+
+    def _key(self, channels, window):
+        return "{}x{}".format(channels, window)
+
+    def _load(self):
+        """ tuned backends by sizes, read from file once """
+        if self.tuned is None:
+            self.tuned = dict()
+            try:
+                with open(self.tuned_file) as tuned_file:
+                    self.tuned.update(json.load(tuned_file))
+            except (IOError, ValueError):
+                pass
+        return self.tuned
+
+    def _save(self):
+        try:
+            with open(self.tuned_file, 'w') as tuned_file:
+                json.dump(self.tuned, tuned_file, indent=1, sort_keys=True)
+        except IOError as error:
+            lib.Debugger.deb("autotune result not saved: {}".format(error))
+
+    def _measure(self, name, core, sorted_list):
+        """
+        mean processing time of backend; instance is only borrowed,
+        so instances used by others stay open
+        """
+        manager = self.create(name)
+        try:
+            """ warm up: start workers, compile kernels """
+            core.process(manager, sorted_list)
+
+            start = default_timer()
+            for x in xrange(self.AUTOTUNE_REPEAT):
+                core.process(manager, sorted_list)
+            return (default_timer()-start)/self.AUTOTUNE_REPEAT
+        finally:
+            self.release(name)
+
+
+REGISTRY = BackendRegistry()
+REGISTRY.register(Model.BACKEND_CUDA, CUDAManager)
+REGISTRY.register(Model.BACKEND_MATRIX, MatrixManager)
+REGISTRY.register(Model.BACKEND_POOL, PoolManager)
+REGISTRY.register(Model.BACKEND_EMULATOR, CUDAEmulator)
+
+
 def main():
-    prog = Model()
-    prog.start_spearman("file", 20, entry_file="../input.txt")
-    while True:
-        result = prog.calculate_loop()
-        if result:
-            print result
-        else:
-            break
-    prog.stop_spearman()
+    import headless
+    headless.main()
 
 if __name__ == '__main__':
     main()
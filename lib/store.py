@@ -0,0 +1,243 @@
+import os
+import mmap
+import glob
+import struct
+import bisect
+
+import numpy as np
+
+"""
+Results store format:
+- directory of segment files segment_NNNNNN.scr
+- segment header (little-endian, HEADER_SIZE bytes):
+  magic "SCRS", version (uint16), pad, channels number (uint32),
+  records number (uint64)
+- records: window time (float64, epoch seconds) and condensed
+  Spearman indexes of all channel pairs (float32),
+  in time order
+"""
+MAGIC = "SCRS"
+VERSION = 1
+HEADER = struct.Struct("<4sHxxIQ")
+COUNT = struct.Struct("<Q")
+COUNT_OFFSET = 12
+HEADER_SIZE = 64
+SEGMENT_NAME = "segment_{:06d}.scr"
+
+
+def record_dtype(channels):
+    pairs = channels*(channels-1)//2
+    return np.dtype([("time", "<f8"), ("values", "<f4", (pairs,))])
+
+
+class ResultsStore(object):
+    """
+    Append-only store of correlation results
+
+    every segment file is preallocated and memory mapped,
+    records are written in place once; time of every
+    INDEX_STEP record of segment makes sparse time index;
+    new segment is started when current one is full
+
+    public methods:
+    - append - add record of one window
+    - find - number of first record not older than given time
+    - read - times and values of records range
+    - flush - write changed pages to disk
+    - close - flush and cut unused tail of last segment
+    """
+    SEGMENT_RECORDS = 2**16
+    INDEX_STEP = 256
+
+    def __init__(self, path, channels=None, readonly=False,
+                 segment_records=SEGMENT_RECORDS):
+        self.path = path
+        self.readonly = readonly
+        self.segment_records = segment_records
+        self.channels = channels
+        self.files = sorted(glob.glob(os.path.join(path, "segment_*.scr")))
+        self.counts = list()
+        self.starts = list()
+        self.index_times = list()
+        self.index_numbers = list()
+        self.mapped = dict()
+        self.active = None
+        self.capacity = segment_records
+        self.last_time = float("-inf")
+
+        if not self.files:
+            if channels is None:
+                raise ValueError("{} is not a results store".format(path))
+            if not readonly and not os.path.isdir(path):
+                os.makedirs(path)
+        self.dtype = None
+
+        for filename in self.files:
+            self._add_segment(filename)
+
+        if self.files and not readonly:
+            self._open_active(self.files[-1])
+
+    def __len__(self):
+        return sum(self.counts)
+
+    def append(self, timestamp, values):
+        """ add record of window ending at <timestamp> """
+        if self.readonly:
+            raise IOError("{} is opened read only".format(self.path))
+        if timestamp < self.last_time:
+            raise ValueError("records must be appended in time order")
+
+        if self.active is None or self.counts[-1] >= self.capacity:
+            self._rollover()
+
+        number = self.counts[-1]
+        self.times_view[number] = timestamp
+        self.values_view[number] = values
+        if number % self.INDEX_STEP == 0:
+            self.index_times.append(timestamp)
+            self.index_numbers.append(self.starts[-1] + number)
+
+        self.counts[-1] = number + 1
+        COUNT.pack_into(self.active_map, COUNT_OFFSET, number + 1)
+        self.last_time = timestamp
+
+    def find(self, timestamp):
+        """ number of first record with time not less than <timestamp> """
+        position = bisect.bisect_left(self.index_times, timestamp)
+        if position == 0:
+            return 0
+
+        """ record is between two index marks of one segment """
+        start = self.index_numbers[position-1]
+        segment = bisect.bisect_right(self.starts, start) - 1
+        stop = self.starts[segment] + self.counts[segment]
+        if position < len(self.index_numbers):
+            stop = min(stop, self.index_numbers[position])
+
+        times = self._segment(segment)["time"][
+            start-self.starts[segment]:stop-self.starts[segment]
+            ]
+        return start + int(np.searchsorted(times, timestamp))
+
+    def read(self, start=0, stop=None):
+        """
+        times and values arrays of records from <start> to <stop>;
+        they are copies, so they stay valid after close
+        """
+        total = len(self)
+        stop = total if stop is None else min(stop, total)
+        start = max(start, 0)
+
+        times = list()
+        values = list()
+        for segment, first in enumerate(self.starts):
+            last = first + self.counts[segment]
+            if last <= start or first >= stop:
+                continue
+            records = self._segment(segment)[
+                max(start, first)-first:min(stop, last)-first
+                ]
+            times.append(records["time"])
+            values.append(records["values"])
+
+        if not times:
+            return (np.empty(0), np.empty((0, self._pairs()), np.float32))
+        """ concatenate copies even single part out of mapped segment """
+        return np.concatenate(times), np.concatenate(values)
+
+    def flush(self):
+        if self.active is not None:
+            self.active_map.flush()
+
+    def close(self):
+        """ flush and cut preallocated tail of last segment """
+        if self.active is not None:
+            self._close_active()
+        self.mapped.clear()
+
+    def _pairs(self):
+        return self.channels*(self.channels-1)//2
+
+    def _add_segment(self, filename):
+        """ read segment header and its sparse index """
+        with open(filename, 'rb') as segment_file:
+            magic, version, channels, count = HEADER.unpack(
+                segment_file.read(HEADER.size)
+                )
+        if magic != MAGIC or version > VERSION:
+            raise ValueError("{} is not a results segment".format(filename))
+        if self.channels is None:
+            self.channels = channels
+        elif channels != self.channels:
+            raise ValueError("store has {} channels, not {}".format(
+                channels, self.channels
+                ))
+        self.dtype = record_dtype(self.channels)
+
+        start = len(self)
+        self.counts.append(count)
+        self.starts.append(start)
+        if count:
+            times = self._segment(len(self.counts)-1)["time"]
+            marks = times[::self.INDEX_STEP]
+            self.index_times.extend(marks.tolist())
+            self.index_numbers.extend(
+                xrange(start, start+count, self.INDEX_STEP)
+                )
+            self.last_time = float(times[-1])
+
+    def _segment(self, segment):
+        """ records array of segment """
+        if segment == len(self.counts)-1 and self.active is not None:
+            return self.records[:self.counts[segment]]
+
+        if segment not in self.mapped:
+            self.mapped[segment] = np.memmap(
+                self.files[segment], dtype=self.dtype, mode='r',
+                offset=HEADER_SIZE, shape=(self.counts[segment],)
+                )
+        return self.mapped[segment]
+
+    def _rollover(self):
+        """ close full segment and start new one """
+        if self.active is not None:
+            self._close_active()
+
+        if self.dtype is None:
+            self.dtype = record_dtype(self.channels)
+        filename = os.path.join(
+            self.path, SEGMENT_NAME.format(len(self.files))
+            )
+        with open(filename, 'wb') as segment_file:
+            segment_file.write(HEADER.pack(MAGIC, VERSION, self.channels, 0))
+        self.starts.append(len(self))
+        self.files.append(filename)
+        self.counts.append(0)
+        self._open_active(filename)
+
+    def _open_active(self, filename):
+        """ preallocate and map segment for appending """
+        self.mapped.pop(len(self.files)-1, None)
+        """ segment written with larger segment_records keeps its size """
+        self.capacity = max(self.segment_records, self.counts[-1])
+        size = HEADER_SIZE + self.capacity*self.dtype.itemsize
+        self.active = open(filename, 'r+b')
+        self.active.truncate(max(size, os.path.getsize(filename)))
+        self.active_map = mmap.mmap(self.active.fileno(), 0)
+
+        self.records = np.frombuffer(
+            self.active_map, dtype=self.dtype,
+            count=self.capacity, offset=HEADER_SIZE
+            )
+        self.times_view = self.records["time"]
+        self.values_view = self.records["values"]
+
+    def _close_active(self):
+        count = self.counts[-1]
+        self.active_map.flush()
+        del self.records, self.times_view, self.values_view
+        self.active_map.close()
+        self.active.truncate(HEADER_SIZE + count*self.dtype.itemsize)
+        self.active.close()
+        self.active = None
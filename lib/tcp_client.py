@@ -1,17 +1,40 @@
+import os
+import sys
+import errno
 import socket
+import select
 import struct
+import time
 from Queue import Queue
 from Queue import Empty as QueueEmpty
-import time
 import multiprocessing as mp
+from collections import deque
+
+import numpy as np
 
 import errors
+from ringbuffer import RingBuffer
 
 COMMAND_CONNECT = "connect"
 COMMAND_REGISTER = "register"
 COMMAND_DISCONNECT = "disconnect"
 
 
+def system_time_to_epoch(values):
+    """
+    convert SYSTEMTIME values (year, month, day of week, day,
+    hour, minute, second, millisecond) of local time to epoch seconds,
+    None if they are not valid time
+    """
+    year, month, dow, day, hour, minute, second, msec = values
+    try:
+        return time.mktime(
+            (year, month, day, hour, minute, second, 0, 0, -1)
+            ) + msec/1000.
+    except (ValueError, OverflowError):
+        return None
+
+
 class TCPCLient(object):
     """
     Simple TCP client
@@ -22,19 +45,40 @@ class TCPCLient(object):
     - connect - initiate socket connection
     - register_client - send client name to NMCServer
     - get_next - receive one data package from server
+    - get_ready - return data package already received, don't wait
+    - receive - receive available data into buffer
     - disconnect - interrupts socket connection
+
+    received data is collected in one preallocated buffer
+    and split to messages by their length prefixes;
+    message returned by get_next is a memoryview of this buffer,
+    valid until next get_next call; message length out of
+    0..MAX_MESSAGE_SIZE closes connection, as messages after it
+    can't be found, and raises TCPErrorServerDisconnect
     """
 
     CLIENT_NAME = "Spearman"
     CLIENTS = dict()
     POLL = 0x7FFFFFFF
     MAX_TCP_SIZE = 2**16
+    BUFFER_SIZE = 4*MAX_TCP_SIZE
+    MAX_MESSAGE_SIZE = 2**24
+    """ nothing to receive now, not an error """
+    RETRY_ERRORS = (errno.EAGAIN, errno.EWOULDBLOCK, errno.EINTR)
+    DISCONNECT_ERRORS = (
+        errno.ECONNRESET, errno.ECONNABORTED, errno.ENETRESET,
+        errno.ENOTCONN, errno.ESHUTDOWN, errno.ETIMEDOUT, errno.EPIPE,
+        errno.EBADF
+        )
+    HEADER = struct.Struct("<ii")
+    CLIENT_INFO = struct.Struct("<ii")
 
     def __init__(self, host, port, clients=CLIENTS):
         self.hpdata = (host, port)
         self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.formatter = HEXFormatter()
         self.clients = clients
+        self._allocate(self.BUFFER_SIZE)
 
     def connect(self):
         """ connect to NMCServer """
@@ -63,20 +107,120 @@ class TCPCLient(object):
     def get_next(self):
         """ receive and prepare next data package """
         while True:
-            rcv = self._receive()
-            result = self._deal_with_recv_data(rcv)
+            message = self._next_message()
+            if message is None:
+                self._receive()
+                continue
+            result = self._deal_with_recv_data(message)
             if result:
                 return result
 
+    def get_ready(self):
+        """
+        prepare next data package from already received data,
+        return None if there is no complete one
+        """
+        while True:
+            message = self._next_message()
+            if message is None:
+                return None
+            result = self._deal_with_recv_data(message)
+            if result:
+                return result
+
+    def receive(self):
+        """ receive data which is ready without parsing it """
+        self._receive()
+
+    def fileno(self):
+        return self.socket.fileno()
+
+    def pending(self):
+        """ number of received bytes not yet returned as messages """
+        return self.end - self.start
+
     def _send(self, data_string):
         """ send some data via tcp """
         self.socket.sendall(data_string)
 
     def _receive(self):
-        """ receive some data via tcp """
-        received_data = self.socket.recv(self.MAX_TCP_SIZE)
+        """ receive some data via tcp into free part of buffer """
+        if self.start == self.end:
+            self.start = self.end = 0
+        elif len(self.buffer) - self.end < self.MAX_TCP_SIZE:
+            self._compact()
+
+        try:
+            received = self.socket.recv_into(self.view[self.end:])
+        except socket.error as error:
+            if error.errno in self.RETRY_ERRORS:
+                return
+            if error.errno not in self.DISCONNECT_ERRORS:
+                raise
+            received = 0
+        if not received:
+            raise errors.TCPErrorServerDisconnect()
+        self.end += received
+
+    def _next_message(self):
+        """
+        cut next complete message from buffer,
+        return None if it is not received completely yet
+        """
+        available = self.end - self.start
+        if available < self.HEADER.size:
+            return None
+
+        sender, value = self.HEADER.unpack_from(self.buffer, self.start)
+        if sender:
+            length = value
+            size = self.HEADER.size + value
+        elif value in (1, -1):
+            """ client info: number and utf-16 name length """
+            if available < self.HEADER.size + self.CLIENT_INFO.size:
+                return None
+            number, name_len = self.CLIENT_INFO.unpack_from(
+                self.buffer, self.start + self.HEADER.size
+                )
+            length = 2*name_len
+            size = self.HEADER.size + self.CLIENT_INFO.size + 2*name_len
+        else:
+            length = 0
+            size = self.HEADER.size
 
-        return received_data
+        if not 0 <= length <= self.MAX_MESSAGE_SIZE:
+            """ stream position is lost, nothing after it can be parsed """
+            self.start = self.end
+            self.disconnect()
+            raise errors.TCPErrorServerDisconnect("broken message length")
+
+        if available < size:
+            self._reserve(size)
+            return None
+
+        message = self.view[self.start:self.start+size]
+        self.start += size
+        return message
+
+    def _allocate(self, size):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.start = self.end = 0
+
+    def _compact(self):
+        """ move incomplete message to buffer beginning """
+        length = self.end - self.start
+        self.view[:length] = self.view[self.start:self.end]
+        self.start, self.end = 0, length
+
+    def _reserve(self, size):
+        """ make buffer able to keep message of <size> bytes """
+        if size + self.MAX_TCP_SIZE <= len(self.buffer):
+            return
+        old_view = self.view[self.start:self.end]
+        self._allocate(size + self.MAX_TCP_SIZE)
+        self.end = len(old_view)
+        self.view[:self.end] = old_view
 
     def _deal_with_recv_data(self, data):
         """ separate server's and clients' commands """
@@ -113,7 +257,7 @@ class TCPCLient(object):
     def _server_command(self, data):
         """ process server's command """
         command = self.formatter.decode_str('i', data[:4])
-        print("\nserver command: {}".format(command))
+        sys.stderr.write("\nserver command: {}\n".format(command))
         if not command:
             self.disconnect()
             raise errors.TCPErrorServerDisconnect()
@@ -180,19 +324,25 @@ class HEXFormatter(object):
 class SpearmanSocketListener(object):
     """
     Simple socket client
+
+    frame samples are decoded at once
+    to (ARRAY_ELEMENTS x ARRAYS_NUMBER) int16 block
     """
     ARRAYS_NUMBER = 29
     ARRAY_ELEMENTS = 24
-    TIME_MASK = "hhhhhhhh"
-    ARRAY_MASK = 'h'*ARRAYS_NUMBER*ARRAY_ELEMENTS
     FRAME_TYPE = 6
+    FRAME_HEADER = struct.Struct("<i8h8h28xi")
+    BLOCK_DTYPE = np.dtype("<i2")
+    BLOCK_SIZE = ARRAYS_NUMBER*ARRAY_ELEMENTS*BLOCK_DTYPE.itemsize
 
-    def __init__(self, host, port):
-        self.tcp_client = TCPCLient(host, port)
+    def __init__(self, host, port, clients=TCPCLient.CLIENTS):
+        self.tcp_client = TCPCLient(host, port, clients)
         self.formatter = HEXFormatter()
         self.que = Queue()
-        # self.dque = Queue()
+        self.lines = deque()
         self.discr = 0
+        self.time_begin = None
+        self.time_end = None
 
     def connect(self):
         return self.tcp_client.connect()
@@ -203,72 +353,110 @@ class SpearmanSocketListener(object):
     def disconnect(self):
         self.tcp_client.disconnect()
 
-    def read_frame(self):
+    def fileno(self):
+        return self.tcp_client.fileno()
+
+    def receive(self):
+        self.tcp_client.receive()
+
+    def read_frame(self, wait=True):
         try:
-            result = self._read_frame()
+            result = self._read_frame(wait)
         except struct.error:
             raise errors.TCPErrorBrokenPackage()
         else:
             return result
 
-    def _read_frame(self):
-        """ read frame according some weird frame format """
+    def _read_frame(self, wait=True):
+        """
+        read frame according some weird frame format;
+        if not <wait>, return None when no complete frame is received
+        """
+        header_size = self.FRAME_HEADER.size
         while True:
-            raw_data = self.tcp_client.get_next()
+            if wait:
+                raw_data = self.tcp_client.get_next()
+            else:
+                raw_data = self.tcp_client.get_ready()
+                if raw_data is None:
+                    return None
             if len(raw_data) >= 4:
                 if self.formatter.decode_str('i', raw_data[:4]) == self.FRAME_TYPE:
                     break
 
-        time_begin = self.formatter.decode_str(self.TIME_MASK, raw_data[4:20])
-        time_end = self.formatter.decode_str(self.TIME_MASK, raw_data[20:36])
-        # reserved = raw_data[36:64]
-        discret_friq = self.formatter.decode_str('i', raw_data[64:68])
-        message = raw_data[68:]
-        msg_len_needed = self.ARRAYS_NUMBER*self.ARRAY_ELEMENTS*2
-
-        if len(message) < msg_len_needed:
+        if len(raw_data) < header_size + self.BLOCK_SIZE:
             raise errors.TCPErrorBrokenPackage()
 
-        raw_array = self.formatter.decode_str(self.ARRAY_MASK, message)
-
-        arrays = list(self._chunks(raw_array, self.ARRAY_ELEMENTS))
-        transponated = zip(*arrays)
-        # print("reserved...")
-        # for x in xrange(len(reserved)/2):
-        #     # zug = reserved[4*x:4+4*x]
-        #     zug = reserved[2*x:2+2*x]
-        #     print(self.formatter.decode_str('h', zug))
-        # print("\nbegin:\t{}\nend:\t{}\ndiscr:\t{}".format(
-        #     time_begin, time_end, discret_friq
-        #     ))
-        return transponated, time_begin, time_end, discret_friq
-
-    def _chunks(self, l, n):
-        """ slice list to N parts """
-        for i in xrange(0, len(l), n):
-            yield l[i:i+n]
+        header = self.FRAME_HEADER.unpack_from(raw_data)
+        time_begin = header[1:9]
+        time_end = header[9:17]
+        discret_friq = header[17]
+
+        """
+        samples are sent electrode by electrode;
+        block is copied out of receive buffer, which is reused
+        """
+        block = np.asarray(raw_data)[header_size:header_size+self.BLOCK_SIZE]
+        block = block.view(self.BLOCK_DTYPE).reshape(
+            self.ARRAYS_NUMBER, self.ARRAY_ELEMENTS
+            ).T.copy()
+
+        return block, time_begin, time_end, discret_friq
 
     def get(self):
+        """ get next line of received blocks """
+        if not self.lines:
+            block = self.get_block()
+            if block is None:
+                return None
+            self.lines.extend(block)
+
+        return self.lines.popleft()
+
+    def ready_blocks(self):
+        """ decode all frames already received without waiting """
+        while True:
+            try:
+                result = self.read_frame(wait=False)
+            except errors.TCPErrorBrokenPackage:
+                continue
+            if result is None:
+                break
+
+            block, self.time_begin, self.time_end, self.discr = result
+            yield block
+
+    def line_times(self, lines):
+        """ epoch time of every line of last frame or None """
+        begin = system_time_to_epoch(self.time_begin)
+        end = system_time_to_epoch(self.time_end)
+        if begin is None:
+            return None
+        if (end is None or end <= begin) and self.discr:
+            end = begin + (lines-1)/float(self.discr)
+        return np.linspace(begin, end or begin, lines)
+
+    def get_block(self):
         """
-        get next line from a queue if it is full,
+        get next block from a queue if it is full,
         overwise receive data from server and
-        fill queue with perpared server data
+        fill queue with perpared server data;
+        None means server disconnected
         """
         if self.que.empty():
             self._fill_queue()
 
-        next_line = self.que.get()
-        return next_line
+        return self.que.get()
 
     def _fill_queue(self):
-        """ add new lines from received packages """
+        """ add new block from received packages """
         while True:
             try:
                 data, begin, end, discr = self.read_frame()
             except errors.TCPErrorBrokenPackage:
                 pass
             except errors.TCPErrorServerDisconnect:
-                data = [None]
+                data = None
                 discr = None
                 break
             else:
@@ -277,8 +465,7 @@ class SpearmanSocketListener(object):
         if self.discr != discr:
             self.discr = discr
 
-        for line in data:
-            self.que.put(line)
+        self.que.put(data)
 
     def get_discr(self):
         return self.discr
@@ -291,19 +478,51 @@ class AsyncManager(object):
     public classes:
     - connect - connect to remote server
     - get - receive data pacakge with length equall frame size
+    - ready - check if get won't wait
+    - catch_up - number of windows to calculate at once
+    - window_times - time of last line of every window of last get
+    - metrics - queue depth, lag and lost samples
     - disconnect - disconnect from remote server
+
+    received lines are passed through shared memory ring buffer;
+    returned windows are views valid until next get
+
+    when more than owerflow limit lines are queued, policy is applied:
+    - drop - skip oldest whole windows
+    - decimate - average every (step+1) lines, lower discretization
+    - batch - don't lose lines, let all queued windows be calculated at once
+    - block - don't lose lines, listener stops receiving while limit
+      lines are queued, so TCP flow control makes server wait
     """
     OWERFLOW_RATE = 100
+    RING_LINES = 2**16
+    DISCONNECT_TIMEOUT = 1.
+    POLICY_DROP = "drop"
+    POLICY_DECIMATE = "decimate"
+    POLICY_BATCH = "batch"
+    POLICY_BLOCK = "block"
+    POLICIES = (POLICY_DROP, POLICY_DECIMATE, POLICY_BATCH, POLICY_BLOCK)
     # DEFAULT_DISCR = 1000
 
-    def __init__(self, host, port, window=10, owerflow_rate=OWERFLOW_RATE):
+    def __init__(self, host, port, window=10, owerflow_rate=OWERFLOW_RATE,
+                 policy=POLICY_DECIMATE):
+        if policy not in self.POLICIES:
+            raise ValueError("unknown overflow policy {}".format(policy))
         self.window = window
         self.owerflow_limit = window * owerflow_rate
-        self.command_que = mp.Queue()
-        self.data_que = mp.Queue()
+        self.policy = policy
+        self.dropped = 0
+        self.merged = 0
+        self.commands, listener_commands = mp.Pipe()
+        self.ring = RingBuffer(
+            max(self.RING_LINES, 4*self.owerflow_limit),
+            SpearmanSocketListener.ARRAYS_NUMBER, timed=True,
+            limit=self.owerflow_limit if policy == self.POLICY_BLOCK else None
+            )
+        self.read_window = window
         self.discr_que = mp.Queue()
         self.tcp_client = AsyncSocketListener(
-            self.command_que, self.data_que, self.discr_que,
+            listener_commands, self.ring, self.discr_que,
             (host, port)
             )
         self.discr = 0
@@ -311,42 +530,107 @@ class AsyncManager(object):
 
     def connect(self):
         self.tcp_client.start()
-        self.command_que.put(COMMAND_CONNECT)
-        self.command_que.put(COMMAND_REGISTER)
+        self.commands.send(COMMAND_CONNECT)
+        self.commands.send(COMMAND_REGISTER)
         # FIXIT: need to handle connection status
         return True
 
     def disconnect(self):
-        self.command_que.put(COMMAND_DISCONNECT)
-        time.sleep(0.01)
-        self.tcp_client.terminate()
-        # self.tcp_client.join()
+        self.commands.send(COMMAND_DISCONNECT)
+        self.ring.close()
+        self.tcp_client.join(self.DISCONNECT_TIMEOUT)
+        if self.tcp_client.is_alive():
+            self.tcp_client.terminate()
 
     def get(self):
-        step = self.data_que.qsize()/self.owerflow_limit
+        step = 0
+        if self.policy == self.POLICY_DECIMATE:
+            step = self.ring.available()/self.owerflow_limit
+        elif self.policy == self.POLICY_DROP:
+            self._drop_windows()
+
         data = self._get(self.window, step)
         discr = self._get_actual_discr(step)
         return data, discr
 
-    def _get(self, number, step):
-        """ receive <number> lines from tcp connection"""
-        steppy = 0
-        result = list()
-
-        for x in xrange(number):
-            while steppy < step:
-                dummy = self.data_que.get()
-                if not dummy:
-                    return None
-                steppy += 1
-            else:
-                next_line = self.data_que.get()
-                if not next_line:
-                    return None
-                result.append(next_line)
-                steppy = 0
+    def ready(self, windows=1):
+        """
+        next <windows> windows are received, as many lines as ring
+        lets listener queue are, or no more data will come
+        """
+        lines = min(windows*self.window, self.ring.limit)
+        return (self.ring.available() >= lines or
+                bool(self.ring.closed.value))
+
+    def window_times(self):
+        """ epoch time of last line of every window of last get """
+        times = self.ring.times()
+        if times is None:
+            return None
+        return times[self.read_window-1::self.read_window]
+
+    def catch_up(self):
+        """ number of queued windows to calculate at once """
+        if self.policy != self.POLICY_BATCH:
+            return 0
+        return self.ring.available()//self.window
+
+    def metrics(self):
+        """
+        current state of received data:
+        - depth - lines waiting for calculation
+        - lag - seconds of waiting lines (None if discretization unknown)
+        - dropped - lines skipped by drop policy
+        - merged - lines averaged away by decimate policy
+        """
+        depth = self.ring.available()
+        discr = self._get_discr()
+        return {
+            "policy": self.policy,
+            "depth": depth,
+            "lag": depth/float(discr) if discr else None,
+            "dropped": self.dropped,
+            "merged": self.merged,
+        }
+
+    def get_batch(self, number):
+        """
+        receive up to <number> complete windows already
+        queued without decimation, wait for one at least
+        """
+        ready = max(self.ring.available()//self.window, 1)
+        number = min(ready, number)
+        lines = self.ring.read(number*self.window)
+        self.read_window = self.window
+        if lines is None:
+            batch = list()
         else:
-            return result
+            batch = lines.reshape(number, self.window, -1)
+        discr = self._get_actual_discr(0)
+        return batch, discr
+
+    def _get(self, number, step):
+        """
+        receive <number> lines from tcp connection,
+        each of them is average of <step>+1 received lines
+        """
+        lines = self.ring.read(number*(step+1))
+        if lines is None:
+            return None
+        self.read_window = number*(step+1)
+        if not step:
+            return lines
+
+        """ average neighbour lines instead of skipping them """
+        self.merged += number*step
+        return lines.reshape(number, step+1, -1).mean(axis=1)
+
+    def _drop_windows(self):
+        """ skip oldest whole windows over owerflow limit """
+        excess = self.ring.available() - self.owerflow_limit
+        if excess > 0:
+            windows = -(-excess//self.window)
+            self.dropped += self.ring.skip(windows*self.window)
 
     def _get_discr(self):
         try:
@@ -370,12 +654,20 @@ class AsyncManager(object):
 
 
 class AsyncSocketListener(mp.Process):
-    """Asyncronous Socket Listener"""
+    """
+    Asyncronous Socket Listener
 
-    def __init__(self, command_que, data_que, discr_que, socket):
+    sleeps in select until server data or command comes;
+    pipes can't be selected on Windows, so there socket
+    is selected with timeout and pipe is polled
+    """
+    SELECT_PIPES = os.name != "nt"
+    POLL_TIME = 0.01
+
+    def __init__(self, commands, ring, discr_que, socket):
         mp.Process.__init__(self)
-        self.command_que = command_que
-        self.data_que = data_que
+        self.commands = commands
+        self.ring = ring
         self.discr_que = discr_que
         self.socket = socket
         self.next = False
@@ -385,16 +677,34 @@ class AsyncSocketListener(mp.Process):
         """ main command listening loop """
         self.tcp_client = SpearmanSocketListener(*self.socket)
 
-        while True:
-            try:
-                command = self.command_que.get_nowait()
-            except QueueEmpty:
-                if self.next:
-                    self._default()
-            else:
-                result = self._command(command)
-                if not result:
-                    break
+        try:
+            while True:
+                for source in self._wait():
+                    if source is self.commands:
+                        if not self._command(self.commands.recv()):
+                            return
+                    else:
+                        self._default()
+        finally:
+            """ consumer never waits for failed listener """
+            self.ring.close()
+
+    def _wait(self):
+        """ wait for command or server data, return ready sources """
+        if self.SELECT_PIPES:
+            sources = [self.commands]
+            if self.next:
+                sources.append(self.tcp_client)
+            return select.select(sources, [], [])[0]
+
+        ready = list()
+        if self.next:
+            ready = select.select([self.tcp_client], [], [], self.POLL_TIME)[0]
+            if self.commands.poll():
+                ready.insert(0, self.commands)
+        elif self.commands.poll(None):
+            ready.append(self.commands)
+        return ready
 
     def _command(self, command):
         """ handle outer command """
@@ -409,6 +719,9 @@ class AsyncSocketListener(mp.Process):
         result = self.tcp_client.connect()
         if result:
             self.next = True
+        else:
+            """ let consumer know there will be no data """
+            self.ring.close()
         return result
 
     def _register(self):
@@ -416,18 +729,27 @@ class AsyncSocketListener(mp.Process):
         return True
 
     def _disconnect(self):
-        self.data_que.put(None)
+        self.ring.close()
         self.tcp_client.disconnect()
         self.next = False
         return False
 
     def _default(self):
         """
-        receive next data line
-        and put it into data queue
+        receive ready data, write all
+        complete blocks into ring buffer
         """
-        result = self.tcp_client.get()
-        self.data_que.put(result)
+        try:
+            self.tcp_client.receive()
+            for block in self.tcp_client.ready_blocks():
+                times = self.tcp_client.line_times(len(block))
+                if not self.ring.write(block, times):
+                    """ consumer finished """
+                    raise errors.TCPErrorServerDisconnect()
+        except errors.TCPErrorServerDisconnect:
+            self.ring.close()
+            self.next = False
+        self._put_discr()
 
     def _put_discr(self):
         discr = self.tcp_client.get_discr()
@@ -0,0 +1,95 @@
+import threading
+
+import lib
+
+
+class LatestSlot(object):
+    """
+    Holder of the newest value passed between threads
+
+    writer never waits for reader: value not taken
+    before next put is replaced and counted as skipped
+
+    public methods:
+    - put - replace value
+    - take - newest value not taken yet or None
+    - close - mark that no more values come
+    - finished - closed and last value taken
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.value = None
+        self.closed = False
+        self.skipped = 0
+
+    def put(self, value):
+        with self.lock:
+            if self.value is not None:
+                self.skipped += 1
+            self.value = value
+
+    def take(self):
+        with self.lock:
+            value, self.value = self.value, None
+            return value
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+
+    def finished(self):
+        with self.lock:
+            return self.closed and self.value is None
+
+
+class CalculationWorker(threading.Thread):
+    """
+    Model calculation loop in background thread
+
+    every result is passed to publisher, if given,
+    and put to slot with its number, where GUI takes
+    only the newest one; when data source ends or worker
+    is stopped, thread stops model and closes slot
+    """
+    JOIN_TIME = 0.2
+
+    def __init__(self, model, slot, publisher=None):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.model = model
+        self.slot = slot
+        self.publisher = publisher
+        self.stopping = False
+        self.windows = 0
+
+    def run(self):
+        try:
+            while not self.stopping:
+                full_dict, discr = self.model.calculate_loop()
+                if not full_dict:
+                    break
+                number = self.windows
+                if self.publisher is not None:
+                    self.publisher.publish(number, full_dict, discr)
+                self.windows += 1
+                self.slot.put((number, full_dict, discr))
+        except Exception as error:
+            """ data source closed under running step is expected """
+            if not self.stopping:
+                lib.Debugger.deb("calculation error: {}".format(error))
+        finally:
+            """ backend is released only when no step uses it """
+            self.model.stop_spearman()
+            self.slot.close()
+
+    def stop(self):
+        """
+        stop after current step and wait for thread end;
+        step waiting for data is woken by stopping data source
+        """
+        self.stopping = True
+        self.join(self.JOIN_TIME)
+        if self.is_alive():
+            self.model.interrupt_spearman()
+        self.join()
@@ -0,0 +1,70 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+import datamanagers as dm
+
+
+class MappedFileReaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def windows(self, text, window=2, block=None):
+        """ first values of lines of all windows and error, if any """
+        filename = os.path.join(self.path, "input.txt")
+        with open(filename, 'w') as input_file:
+            input_file.write(text)
+        reader = dm.MappedFileReader()
+        if block:
+            reader.BLOCK_SIZE = block
+        reader.start(filename, window)
+
+        result = list()
+        error = None
+        try:
+            while True:
+                lines, discr = reader.get()
+                if lines is None:
+                    break
+                result.append(lines[:, 0].tolist())
+        except ValueError as error:
+            pass
+        reader.stop()
+        return result, error
+
+    def test_lines(self):
+        result, error = self.windows("1 2 3\n4 5 6\n7 8 9\n10 11 12\n")
+        self.assertEqual(result, [[1, 4], [7, 10]])
+        self.assertIsNone(error)
+
+    def test_blank_lines(self):
+        result, error = self.windows("1 2 3\n\n4 5 6\r\n7 8 9\n  \n10 11 12")
+        self.assertEqual(result, [[1, 4], [7, 10]])
+        self.assertIsNone(error)
+
+    def test_wrong_lines(self):
+        for text in ("1 2\n", "1 2 3 4\n", "1 x 3\n", "4 5\n6 7 8 9\n"):
+            result, error = self.windows(
+                "1 2 3\n4 5 6\n7 8 9\n10 11 12\n" + text + "13 14 15\n"
+                )
+            self.assertEqual(result, [[1, 4], [7, 10]])
+            self.assertIn("line 5 ", str(error))
+
+    def test_wrong_line_in_later_block(self):
+        """ windows of blocks before wrong line come out """
+        text = "1 2 3\n"*9 + "1 2\n" + "1 2 3\n"*4
+        result, error = self.windows(text, 3, block=16)
+        self.assertEqual(len(result), 3)
+        self.assertIn("line 10 ", str(error))
+
+
+if __name__ == '__main__':
+    unittest.main()
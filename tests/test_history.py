@@ -0,0 +1,51 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+from store import ResultsStore
+from history import ResultsHistory
+
+
+class ResultsHistoryTest(unittest.TestCase):
+    CHANNELS = 3
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        self.store = ResultsStore(self.path, self.CHANNELS)
+
+    def tearDown(self):
+        self.store.close()
+        shutil.rmtree(self.path)
+
+    def append(self, times):
+        for timestamp in times:
+            self.store.append(timestamp, np.full(3, timestamp % 60))
+
+    def test_torn_summary_row(self):
+        """ update after interrupted one appends whole rows """
+        self.append(np.arange(0., 125., 5.))
+        history = ResultsHistory(self.store)
+        history.update()
+        path = history._summary_path(60.)
+        self.assertEqual(len(history._summary(60.)), 2)
+        with open(path, 'ab') as summary_file:
+            summary_file.write("\0"*10)
+
+        self.append(np.arange(125., 185., 5.))
+        history.update()
+        self.assertEqual(
+            os.path.getsize(path), 3*history.dtype.itemsize
+            )
+        summary = history._summary(60.)
+        np.testing.assert_array_equal(summary["start"], [0., 60., 120.])
+        np.testing.assert_array_equal(summary["count"], [12, 12, 12])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import sys
+import threading
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+from tcp_client import AsyncManager
+from test_ringbuffer import block
+
+
+class OverflowPolicyTest(unittest.TestCase):
+    """
+    policies of queued lines; listener process is not started,
+    lines are written to ring buffer as it would do
+    """
+    WINDOW = 2
+    RATE = 2
+
+    def manager(self, policy):
+        manager = AsyncManager(
+            "127.0.0.1", 0, self.WINDOW, self.RATE, policy=policy
+            )
+        manager.ring.WAIT = 0.01
+        return manager
+
+    def write(self, manager, start, size):
+        channels = manager.ring.channels
+        self.assertTrue(manager.ring.write(block(start, size, channels)))
+
+    def test_unknown(self):
+        self.assertRaises(ValueError, self.manager, "wait")
+
+    def test_drop(self):
+        manager = self.manager(AsyncManager.POLICY_DROP)
+        self.write(manager, 0, 9)
+        """ 5 lines over limit of 4, 3 whole oldest windows are dropped """
+        lines, discr = manager.get()
+        self.assertEqual(lines[:, 0].tolist(), [6, 7])
+        self.assertEqual(manager.metrics()["dropped"], 6)
+        self.assertEqual(manager.metrics()["merged"], 0)
+        self.assertEqual(manager.catch_up(), 0)
+
+    def test_decimate(self):
+        manager = self.manager(AsyncManager.POLICY_DECIMATE)
+        self.write(manager, 0, 8)
+        """ twice over limit: every 3 lines are averaged """
+        lines, discr = manager.get()
+        self.assertEqual(lines[:, 0].tolist(), [1., 4.])
+        self.assertEqual(manager.metrics()["merged"], 4)
+        self.assertEqual(manager.metrics()["depth"], 2)
+        lines, discr = manager.get()
+        self.assertEqual(lines[:, 0].tolist(), [6, 7])
+
+    def test_batch(self):
+        manager = self.manager(AsyncManager.POLICY_BATCH)
+        self.write(manager, 0, 9)
+        self.assertEqual(manager.catch_up(), 4)
+        batch, discr = manager.get_batch(manager.catch_up())
+        self.assertEqual(batch.shape[:2], (4, self.WINDOW))
+        self.assertEqual(batch[..., 0].ravel().tolist(), range(8))
+        self.assertEqual(manager.metrics()["dropped"], 0)
+        self.assertEqual(manager.metrics()["merged"], 0)
+        self.assertEqual(manager.metrics()["depth"], 1)
+
+    def test_block(self):
+        manager = self.manager(AsyncManager.POLICY_BLOCK)
+        limit = self.WINDOW*self.RATE
+        self.assertEqual(manager.ring.limit, limit)
+
+        """ writer waits once limit lines are queued """
+        writer = threading.Thread(target=lambda: [
+            self.write(manager, start, 2) for start in xrange(0, 10, 2)
+            ])
+        writer.start()
+        writer.join(0.2)
+        self.assertTrue(writer.is_alive())
+        self.assertEqual(manager.metrics()["depth"], limit)
+
+        """ nothing is lost or merged while reader catches up """
+        result = list()
+        for x in xrange(5):
+            lines, discr = manager.get()
+            result.extend(lines[:, 0].tolist())
+        writer.join(1.)
+        self.assertFalse(writer.is_alive())
+        self.assertEqual(result, range(10))
+        self.assertEqual(manager.metrics()["dropped"], 0)
+        self.assertEqual(manager.metrics()["merged"], 0)
+        self.assertEqual(manager.catch_up(), 0)
+
+    def test_ready(self):
+        manager = self.manager(AsyncManager.POLICY_BLOCK)
+        self.write(manager, 0, 3)
+        self.assertTrue(manager.ready())
+        self.assertFalse(manager.ready(2))
+        self.write(manager, 3, 1)
+        self.assertTrue(manager.ready(2))
+        """ more windows than ring lets queue need only limit lines """
+        self.assertTrue(manager.ready(10))
+
+    def test_limit_only_for_block(self):
+        for policy in AsyncManager.POLICIES:
+            ring = self.manager(policy).ring
+            if policy == AsyncManager.POLICY_BLOCK:
+                self.assertLess(ring.limit, ring.lines)
+            else:
+                self.assertEqual(ring.limit, ring.lines)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import threading
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+from ringbuffer import RingBuffer
+
+
+def block(start, size, channels=3):
+    """ lines numbered from <start>, every value of line is its number """
+    return np.repeat(np.arange(start, start+size), channels).reshape(
+        size, channels
+        )
+
+
+class RingBufferTest(unittest.TestCase):
+
+    def setUp(self):
+        self.ring = RingBuffer(8, 3)
+
+    def test_wraparound(self):
+        """
+        head and tail pass buffer end many times;
+        lines of last read are kept, so every write fits beside them
+        """
+        written = read = 0
+        for size in (5, 3, 4, 4, 2, 6, 1, 7, 1, 5):
+            self.assertTrue(self.ring.write(block(written, size)))
+            written += size
+            lines = self.ring.read(size)
+            np.testing.assert_array_equal(lines, block(read, size))
+            read += size
+        self.assertEqual(self.ring.available(), 0)
+        self.assertEqual(self.ring.head.value, written)
+
+    def test_wrapped_read(self):
+        """ window wrapping around buffer end keeps line order """
+        self.ring.write(block(0, 6))
+        for x in xrange(3):
+            self.ring.read(2)
+        self.ring.write(block(6, 4))
+        np.testing.assert_array_equal(self.ring.read(4), block(6, 4))
+
+    def test_partial_reads(self):
+        self.ring.write(block(0, 8))
+        np.testing.assert_array_equal(self.ring.read(3), block(0, 3))
+        self.assertEqual(self.ring.available(), 5)
+        np.testing.assert_array_equal(self.ring.read(5), block(3, 5))
+        self.assertEqual(self.ring.available(), 0)
+
+    def test_skip(self):
+        self.ring.write(block(0, 6))
+        self.assertEqual(self.ring.skip(4), 4)
+        np.testing.assert_array_equal(self.ring.read(2), block(4, 2))
+
+    def test_skip_more_than_available(self):
+        self.ring.write(block(0, 5))
+        self.ring.read(2)
+        """ lines of previous read are released, not skipped again """
+        self.assertEqual(self.ring.skip(10), 3)
+        self.assertEqual(self.ring.available(), 0)
+        self.assertEqual(self.ring.tail.value, 5)
+
+    def test_view_valid_until_next_read(self):
+        """ writer can't overwrite lines of last read """
+        self.ring.write(block(0, 4))
+        lines = self.ring.read(4)
+        self.ring.WAIT = 0.01
+        self.ring.write(block(4, 4))
+
+        writer = threading.Thread(
+            target=self.ring.write, args=(block(8, 4),)
+            )
+        writer.start()
+        writer.join(0.2)
+        self.assertTrue(writer.is_alive())
+        np.testing.assert_array_equal(lines, block(0, 4))
+
+        """ next read releases the view and lets writer continue """
+        np.testing.assert_array_equal(self.ring.read(4), block(4, 4))
+        writer.join(1.)
+        self.assertFalse(writer.is_alive())
+        np.testing.assert_array_equal(self.ring.read(4), block(8, 4))
+
+    def test_times(self):
+        ring = RingBuffer(4, 3, timed=True)
+        ring.write(block(0, 3), np.arange(3.))
+        ring.read(1)
+        ring.read(2)
+        np.testing.assert_array_equal(ring.times(), [1., 2.])
+        """ lines written without times """
+        ring.write(block(3, 2))
+        ring.read(2)
+        times = ring.times()
+        self.assertEqual(len(times), 2)
+        self.assertTrue(np.isnan(times).all())
+        self.assertIsNone(self.ring.times())
+
+    def test_close(self):
+        self.ring.write(block(0, 2))
+        self.ring.close()
+        self.assertIsNone(self.ring.read(3))
+        self.assertFalse(self.ring.write(block(2, 1)))
+
+    def test_close_wakes_reader(self):
+        result = list()
+        reader = threading.Thread(
+            target=lambda: result.append(self.ring.read(2))
+            )
+        reader.start()
+        self.ring.close()
+        reader.join(1.)
+        self.assertFalse(reader.is_alive())
+        self.assertEqual(result, [None])
+
+    def test_too_large(self):
+        self.assertRaises(ValueError, self.ring.write, block(0, 9))
+        self.assertRaises(ValueError, self.ring.read, 9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,167 @@
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+from store import ResultsStore, HEADER_SIZE, record_dtype
+
+
+class SmallStore(ResultsStore):
+    """ few records pro segment and index mark, so tests cross them """
+    SEGMENT_RECORDS = 10
+    INDEX_STEP = 4
+
+
+class ResultsStoreTest(unittest.TestCase):
+    CHANNELS = 4
+    RECORDS = 35
+
+    def setUp(self):
+        self.path = tempfile.mkdtemp()
+        """ repeated times cross index marks and segment ends """
+        self.times = np.repeat(np.arange(100., 100. + self.RECORDS//2), 2)
+        self.times = np.append(self.times, self.times[-1] + .5)
+        pairs = self.CHANNELS*(self.CHANNELS-1)//2
+        self.values = np.arange(
+            self.RECORDS*pairs, dtype=np.float32
+            ).reshape(self.RECORDS, pairs)
+
+    def tearDown(self):
+        shutil.rmtree(self.path)
+
+    def open(self, channels=None, readonly=False):
+        return SmallStore(
+            self.path, channels, readonly, SmallStore.SEGMENT_RECORDS
+            )
+
+    def fill(self, number=RECORDS):
+        store = self.open(self.CHANNELS)
+        for timestamp, values in zip(self.times[:number],
+                                     self.values[:number]):
+            store.append(timestamp, values)
+        return store
+
+    def segments(self):
+        return sorted(
+            name for name in os.listdir(self.path) if name.endswith(".scr")
+            )
+
+    def test_rollover(self):
+        store = self.fill()
+        self.assertEqual(len(store), self.RECORDS)
+        self.assertEqual(len(self.segments()), 4)
+        times, values = store.read()
+        np.testing.assert_array_equal(times, self.times)
+        np.testing.assert_array_equal(values, self.values)
+
+        """ range crossing two segment ends """
+        times, values = store.read(8, 23)
+        np.testing.assert_array_equal(times, self.times[8:23])
+        np.testing.assert_array_equal(values, self.values[8:23])
+        store.close()
+
+        """ closed segment is cut to its records """
+        itemsize = record_dtype(self.CHANNELS).itemsize
+        self.assertEqual(
+            os.path.getsize(os.path.join(self.path, self.segments()[-1])),
+            HEADER_SIZE + 5*itemsize
+            )
+
+    def test_reopen(self):
+        self.fill(25).close()
+
+        store = self.open(readonly=True)
+        self.assertEqual(store.channels, self.CHANNELS)
+        self.assertEqual(len(store), 25)
+        self.assertEqual(store.last_time, self.times[24])
+        store.close()
+
+        """ appending continues in last, not full segment """
+        store = self.open()
+        for timestamp, values in zip(self.times[25:], self.values[25:]):
+            store.append(timestamp, values)
+        times, values = store.read()
+        np.testing.assert_array_equal(times, self.times)
+        np.testing.assert_array_equal(values, self.values)
+        self.assertEqual(len(self.segments()), 4)
+        store.close()
+
+    def test_reopen_smaller_segments(self):
+        """ segment written with more records than segment_records """
+        store = SmallStore(self.path, self.CHANNELS, segment_records=30)
+        for timestamp, values in zip(self.times[:25], self.values[:25]):
+            store.append(timestamp, values)
+        store.close()
+
+        store = self.open()
+        times, values = store.read()
+        np.testing.assert_array_equal(times, self.times[:25])
+        np.testing.assert_array_equal(values, self.values[:25])
+        for timestamp, values in zip(self.times[25:], self.values[25:]):
+            store.append(timestamp, values)
+        times, values = store.read()
+        np.testing.assert_array_equal(times, self.times)
+        np.testing.assert_array_equal(values, self.values)
+        self.assertEqual(len(self.segments()), 2)
+        store.close()
+
+    def test_find(self):
+        """ sparse index lookup agrees with search over all times """
+        store = self.fill()
+        probes = np.concatenate((
+            self.times, self.times + .25, [0., 99.9, 1e10]
+            ))
+        for timestamp in probes:
+            self.assertEqual(
+                store.find(timestamp),
+                np.searchsorted(self.times, timestamp),
+                timestamp
+                )
+        store.close()
+
+        """ index is rebuilt from segments on reopen """
+        store = self.open(readonly=True)
+        for timestamp in probes:
+            self.assertEqual(
+                store.find(timestamp), np.searchsorted(self.times, timestamp)
+                )
+
+    def test_read_after_close(self):
+        store = self.fill(7)
+        times, values = store.read()
+        store.close()
+        np.testing.assert_array_equal(times, self.times[:7])
+        np.testing.assert_array_equal(values, self.values[:7])
+
+    def test_read_empty(self):
+        store = self.fill(0)
+        times, values = store.read()
+        self.assertEqual(len(times), 0)
+        self.assertEqual(values.shape, (0, 6))
+        self.assertEqual(store.find(100.), 0)
+
+    def test_time_order(self):
+        store = self.fill(3)
+        self.assertRaises(ValueError, store.append, 0., self.values[0])
+        store.close()
+
+    def test_readonly(self):
+        self.fill(3).close()
+        store = self.open(readonly=True)
+        self.assertRaises(IOError, store.append, 1e10, self.values[0])
+
+    def test_channels(self):
+        self.fill(3).close()
+        self.assertRaises(ValueError, self.open, self.CHANNELS+1)
+        self.assertRaises(
+            ValueError, SmallStore, os.path.join(self.path, "empty")
+            )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import sys
+import socket
+import struct
+import unittest
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "lib"))
+
+import errors
+from tcp_client import SpearmanSocketListener
+
+
+def frame(number):
+    """ client message with data frame, every sample is <number> """
+    listener = SpearmanSocketListener
+    header = listener.FRAME_HEADER.pack(
+        listener.FRAME_TYPE, *([0]*16 + [1000])
+        )
+    samples = np.empty(
+        listener.ARRAYS_NUMBER*listener.ARRAY_ELEMENTS, dtype="<i2"
+        )
+    samples.fill(number)
+    data = header + samples.tostring()
+    return struct.pack("<ii", 1, len(data)) + data
+
+
+class SocketListenerTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.bind(("127.0.0.1", 0))
+        self.server.listen(1)
+        self.listener = SpearmanSocketListener(*self.server.getsockname())
+        self.assertTrue(self.listener.connect())
+        self.peer = self.server.accept()[0]
+
+    def tearDown(self):
+        self.peer.close()
+        self.server.close()
+        self.listener.disconnect()
+
+    def send(self, data):
+        """ send data and receive all of it """
+        self.peer.sendall(data)
+        client = self.listener.tcp_client
+        while client.pending() < len(data):
+            self.listener.receive()
+
+    def blocks(self):
+        return [block[0, 0] for block in self.listener.ready_blocks()]
+
+    def test_frames(self):
+        self.send(frame(1) + frame(2))
+        self.assertEqual(self.blocks(), [1, 2])
+
+    def test_split_frame(self):
+        data = frame(3)
+        self.send(data[:100])
+        self.assertEqual(self.blocks(), [])
+        self.send(data[100:])
+        self.assertEqual(self.blocks(), [3])
+
+    def broken_length(self, length):
+        """ frames after broken length are never parsed """
+        self.send(
+            frame(1) + struct.pack("<ii", 1, length) + frame(2) + frame(3)
+            )
+        blocks = list()
+        with self.assertRaises(errors.TCPErrorServerDisconnect):
+            for block in self.listener.ready_blocks():
+                blocks.append(block[0, 0])
+        self.assertEqual(blocks, [1])
+        """ connection is closed """
+        self.assertRaises(
+            errors.TCPErrorServerDisconnect, self.listener.receive
+            )
+
+    def test_negative_length(self):
+        self.broken_length(-5)
+
+    def test_too_large_length(self):
+        self.broken_length(2**30)
+
+
+if __name__ == '__main__':
+    unittest.main()